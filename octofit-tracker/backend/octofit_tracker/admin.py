@@ -1,5 +1,7 @@
 from django.contrib import admin
+from .changelist import DistinctValuesFilter, LargeCollectionAdmin
 from .models import User, Team, Activity, Leaderboard, Workout
+from .pagination import ActivityPagination, LeaderboardPagination
 
 
 @admin.register(User)
@@ -21,21 +23,25 @@ class TeamAdmin(admin.ModelAdmin):
 
 
 @admin.register(Activity)
-class ActivityAdmin(admin.ModelAdmin):
+class ActivityAdmin(LargeCollectionAdmin):
     """Admin interface for Activity model."""
     list_display = ['user_id', 'activity_type', 'duration', 'distance', 'calories', 'date']
-    list_filter = ['activity_type', 'date']
-    search_fields = ['user_id', 'activity_type']
+    list_filter = [DistinctValuesFilter.on('activity_type'), 'date']
+    search_fields = ['user_id']
+    search_help_text = 'Search by the beginning of a user id (case-sensitive).'
     ordering = ['-date']
+    keyset_pagination_class = ActivityPagination
 
 
 @admin.register(Leaderboard)
-class LeaderboardAdmin(admin.ModelAdmin):
+class LeaderboardAdmin(LargeCollectionAdmin):
     """Admin interface for Leaderboard model."""
     list_display = ['user_name', 'team_name', 'total_points', 'total_activities', 'rank']
-    list_filter = ['team_name', 'rank']
-    search_fields = ['user_name', 'team_name']
+    list_filter = [DistinctValuesFilter.on('team_name', source=('teams', 'name'))]
+    search_fields = ['user_name']
+    search_help_text = 'Search by the beginning of a user name (case-sensitive).'
     ordering = ['rank']
+    keyset_pagination_class = LeaderboardPagination
 
 
 @admin.register(Workout)
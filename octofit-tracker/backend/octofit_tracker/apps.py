@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    name = 'octofit_tracker'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .pool_metrics import register_pool_listener
+        from .profiling import register_command_listener
+        register_command_listener()
+        register_pool_listener()
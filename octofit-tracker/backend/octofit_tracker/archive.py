@@ -0,0 +1,328 @@
+"""
+Hot/cold tiering of activities.
+
+``archive_activities`` moves activities older than
+``settings.ACTIVITY_ARCHIVE['AFTER_DAYS']`` out of the activities
+collection into the configured archive backend (``CollectionArchive`` or
+the gzipped NDJSON files of ``FileArchive``), in batches.
+
+Archiving leaves the leaderboard and the rollups as they are. Before a
+batch leaves the activities collection its totals are folded into the
+per-user ``archived_activity_totals``, which ``leaderboard.rebuild`` adds
+back. The batch's dedupe keys are recorded in ``archived_dedupe_keys``
+too, so a retried upload of an archived activity is still recognised
+(see ``dedupe.existing_ids``). The cutoff is rounded down to a Monday
+and recorded as the watermark: rollup buckets before it are frozen and
+kept by ``rollups.rebuild``, which recomputes only the later buckets.
+
+The activities list reads the archive too when its ``date__gte`` or
+``date__lte`` filter reaches before the watermark.
+"""
+import glob
+import gzip
+import os
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId, json_util
+from django.conf import settings
+from django.utils.module_loading import import_string
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from . import ingest
+from .filters import date_range
+from .mongo import get_db
+
+STATE_COLLECTION = 'archive_state'
+TOTALS_COLLECTION = 'archived_activity_totals'
+KEYS_COLLECTION = 'archived_dedupe_keys'
+# Batch ids kept per user to make folding a replayed batch a no-op.
+RECENT_BATCHES = 20
+JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+
+_archive = None
+
+
+def get_archive():
+    """Return the archive backend configured by ``settings.ACTIVITY_ARCHIVE``."""
+    global _archive
+    if _archive is None:
+        config = settings.ACTIVITY_ARCHIVE
+        _archive = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _archive
+
+
+def watermark():
+    """Return the date before which activities may be archived, or None."""
+    state = get_db()[STATE_COLLECTION].find_one({'_id': 'activities'}, {'watermark': 1})
+    return state['watermark'] if state else None
+
+
+def archive_cutoff(after_days, now=None):
+    """The Monday at or before ``after_days`` ago, so weekly buckets are never split."""
+    day = (now or datetime.utcnow()) - timedelta(days=after_days)
+    day = datetime(day.year, day.month, day.day)
+    return day - timedelta(days=day.weekday())
+
+
+def archive_activities(after_days=None, batch_size=None):
+    """
+    Move the activities dated before the archive cutoff to the archive.
+
+    Each batch is written to the archive, journaled, folded into the
+    archived totals and deleted from the activities collection; a batch
+    interrupted part way is finished by the next run. Returns the number
+    of activities moved.
+    """
+    config = settings.ACTIVITY_ARCHIVE
+    after_days = config.get('AFTER_DAYS', 30) if after_days is None else after_days
+    batch_size = batch_size or config.get('BATCH_SIZE', 1000)
+    db = get_db()
+    state = db[STATE_COLLECTION]
+    pending = (state.find_one({'_id': 'activities'}) or {}).get('pending')
+    if pending:
+        _finish_batch(pending['batch'], pending['ids'])
+
+    # The watermark never moves back: buckets before it are frozen.
+    cutoff = max(archive_cutoff(after_days), watermark() or datetime.min)
+    state.update_one({'_id': 'activities'}, {'$set': {'watermark': cutoff}}, upsert=True)
+    moved = 0
+    while True:
+        documents = list(db.activities.find({'date': {'$lt': cutoff}}).sort('_id', 1).limit(batch_size))
+        if not documents:
+            return moved
+        get_archive().write(documents)
+        batch_id = ObjectId()
+        ids = [document['_id'] for document in documents]
+        state.update_one({'_id': 'activities'}, {'$set': {'pending': {'batch': batch_id, 'ids': ids}}})
+        _finish_batch(batch_id, ids)
+        moved += len(documents)
+
+
+def archived_totals():
+    """Return {user_id: (points, activities)} for the archived activities."""
+    return {
+        document['_id']: (document['total_points'], document['total_activities'])
+        for document in get_db()[TOTALS_COLLECTION].find({}, {'total_points': 1, 'total_activities': 1})
+    }
+
+
+def archived_ids(keys):
+    """Return {dedupe_key: _id} for the archived activities with the given keys."""
+    cursor = get_db()[KEYS_COLLECTION].find({'_id': {'$in': list(keys)}})
+    return {document['_id']: document['activity_id'] for document in cursor}
+
+
+def reads_archive(params):
+    """Whether a date filter in ``params`` reaches before the watermark."""
+    dates = [_naive_utc(value) for value in date_range(params).values()]
+    if not dates:
+        return False
+    boundary = watermark()
+    return boundary is not None and min(dates) < boundary
+
+
+def find_activities(query, sort, limit, fields=None):
+    """
+    ``find`` over both tiers: the first ``limit`` activities of the live
+    collection and the archive together, limited to ``fields`` (and _id)
+    if given. An activity caught in both while it is being moved is
+    returned once.
+    """
+    documents = {}
+    for document in get_archive().find(query, sort, limit, fields):
+        documents[document['_id']] = document
+    for document in get_db().activities.find(query, fields).sort(sort).limit(limit):
+        documents[document['_id']] = document
+    return sort_documents(list(documents.values()), sort)[:limit]
+
+
+def clear():
+    """Drop the archive, its totals and its state, e.g. when reseeding."""
+    db = get_db()
+    db[STATE_COLLECTION].drop()
+    db[TOTALS_COLLECTION].drop()
+    db[KEYS_COLLECTION].drop()
+    get_archive().clear()
+
+
+def _finish_batch(batch_id, ids):
+    """Fold a written batch into the archived totals and delete it; idempotent."""
+    db = get_db()
+    documents = list(db.activities.find({'_id': {'$in': ids}}, {'user_id': 1, 'calories': 1, 'dedupe_key': 1}))
+    totals = {}
+    for document in documents:
+        points, count = totals.get(document['user_id'], (0, 0))
+        totals[document['user_id']] = (points + document['calories'], count + 1)
+    if totals:
+        try:
+            db[TOTALS_COLLECTION].bulk_write([
+                UpdateOne(
+                    {'_id': user_id, 'batches': {'$ne': batch_id}},
+                    {
+                        '$inc': {'total_points': points, 'total_activities': count},
+                        '$push': {'batches': {'$each': [batch_id], '$slice': -RECENT_BATCHES}},
+                    },
+                    upsert=True,
+                )
+                for user_id, (points, count) in totals.items()
+            ], ordered=False)
+        except BulkWriteError as exc:
+            # A duplicate key means the batch was already folded for that user.
+            if any(error['code'] != ingest.DUPLICATE_KEY for error in exc.details['writeErrors']):
+                raise
+    keys = [
+        {'_id': document['dedupe_key'], 'activity_id': document['_id']}
+        for document in documents if document.get('dedupe_key')
+    ]
+    if keys:
+        try:
+            db[KEYS_COLLECTION].insert_many(keys, ordered=False)
+        except BulkWriteError as exc:
+            # Keys recorded by an earlier attempt at the batch.
+            if any(error['code'] != ingest.DUPLICATE_KEY for error in exc.details['writeErrors']):
+                raise
+    # Deleted only once every user's totals and keys hold the batch.
+    db.activities.delete_many({'_id': {'$in': ids}})
+    db[STATE_COLLECTION].update_one({'_id': 'activities'}, {'$unset': {'pending': ''}})
+
+
+class CollectionArchive:
+    """Archive to a Mongo collection, indexed like the activities list."""
+
+    def __init__(self, collection='activities_archive'):
+        self.collection_name = collection
+
+    @property
+    def collection(self):
+        return get_db()[self.collection_name]
+
+    def write(self, documents):
+        if 'dedupe_key_unique' not in self.collection.index_information():
+            self.collection.create_index([('date', -1), ('_id', -1)], name='date_id')
+            self.collection.create_index([('user_id', 1), ('date', -1)], name='user_id_date')
+            self.collection.create_index([('dedupe_key', 1)], name='dedupe_key_unique', unique=True,
+                                         partialFilterExpression={'dedupe_key': {'$type': 'string'}})
+        ingest.insert_activities(documents, self.collection)
+
+    def find(self, query, sort, limit, fields=None):
+        return list(self.collection.find(query, fields).sort(sort).limit(limit))
+
+    def clear(self):
+        self.collection.drop()
+
+
+class FileArchive:
+    """
+    Archive to gzipped NDJSON files, one per batch, named by the batch's
+    date range so reads open only the files that can match. Reads sorted
+    by date open the files in that order and stop once no file left can
+    reach the first ``limit`` activities.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, documents):
+        os.makedirs(self.directory, exist_ok=True)
+        dates = [document['date'] for document in documents]
+        name = f'activities-{min(dates):%Y%m%dT%H%M%S}-{max(dates):%Y%m%dT%H%M%S}-{documents[0]["_id"]}.ndjson.gz'
+        path = os.path.join(self.directory, name)
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as handle:
+            for document in documents:
+                handle.write(json_util.dumps(document, json_options=JSON_OPTIONS) + '\n')
+        os.replace(path + '.tmp', path)
+
+    def find(self, query, sort, limit, fields=None):
+        low, high = _date_bounds(query)
+        files = []
+        for path in glob.glob(os.path.join(self.directory, 'activities-*.ndjson.gz')):
+            first, last = (datetime.strptime(part, '%Y%m%dT%H%M%S') for part in os.path.basename(path).split('-')[1:3])
+            if (high is not None and first > high) or (low is not None and last < low):
+                continue
+            # Names keep whole seconds: the batch's dates are in [first, last + 1s).
+            files.append((first, last + timedelta(seconds=1), path))
+        by_date = sort[0][0] == 'date'
+        descending = sort[0][1] < 0
+        files.sort(key=lambda file: file[1] if descending else file[0], reverse=descending)
+
+        documents = []
+        for first, end, path in files:
+            if by_date and len(documents) >= limit:
+                documents = sort_documents(documents, sort)[:limit]
+                bound = _naive_utc(documents[-1]['date'])
+                if (end <= bound) if descending else (first > bound):
+                    break
+            with gzip.open(path, 'rt', encoding='utf-8') as handle:
+                for line in handle:
+                    document = json_util.loads(line, json_options=JSON_OPTIONS)
+                    if _matches(document, query):
+                        documents.append(document)
+        documents = sort_documents(documents, sort)[:limit]
+        if fields is not None:
+            documents = [
+                {field: document[field] for field in ['_id', *fields] if field in document} for document in documents
+            ]
+        return documents
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.directory, 'activities-*.ndjson.gz')):
+            os.remove(path)
+
+
+def sort_documents(documents, sort):
+    """Sort raw documents by a pymongo sort specification."""
+    for field, direction in reversed(sort):
+        documents.sort(key=lambda document: document[field], reverse=direction < 0)
+    return documents
+
+
+def _date_bounds(query):
+    """The widest (low, high) date range a filter of activity_filter's shape allows."""
+    low = high = None
+    conditions = query.get('$and', [query])
+    for condition in conditions:
+        date = condition.get('date')
+        if isinstance(date, dict):
+            for operator in ('$gte', '$gt'):
+                if operator in date:
+                    low = _naive_utc(date[operator])
+            for operator in ('$lte', '$lt'):
+                if operator in date:
+                    high = _naive_utc(date[operator])
+    return low, high
+
+
+COMPARISONS = {
+    '$in': lambda value, operand: value in operand,
+    '$gte': lambda value, operand: value is not None and value >= operand,
+    '$gt': lambda value, operand: value is not None and value > operand,
+    '$lte': lambda value, operand: value is not None and value <= operand,
+    '$lt': lambda value, operand: value is not None and value < operand,
+}
+
+
+def _matches(document, query):
+    """Evaluate the subset of Mongo filters built by activity_filter and the keyset pagination."""
+    for key, condition in query.items():
+        if key == '$and':
+            if not all(_matches(document, part) for part in condition):
+                return False
+        elif key == '$or':
+            if not any(_matches(document, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = _naive_utc(document.get(key))
+            for operator, operand in condition.items():
+                operand = [_naive_utc(item) for item in operand] if operator == '$in' else _naive_utc(operand)
+                if not COMPARISONS[operator](value, operand):
+                    return False
+        elif _naive_utc(document.get(key)) != _naive_utc(condition):
+            return False
+    return True
+
+
+def _naive_utc(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
@@ -0,0 +1,94 @@
+"""
+Async versions of the hot read endpoints.
+
+The activities list, leaderboard list and stats endpoints are mirrored
+here as plain Django async views that query Mongo through motor, so a
+request waiting on the database does not hold a worker thread. Served
+through ``asgi.py``, one process can keep hundreds of slow requests in
+flight. The responses match the DRF endpoints they mirror; an activities
+list whose date filter reaches the archive tier is read through the
+synchronous ``archive.find_activities`` on a worker thread.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from . import archive, rollups
+from .filters import activity_filter
+from .models import Activity
+from .mongo import get_async_db
+from .pagination import ActivityPagination, LeaderboardPagination
+from .serializers import ActivitySerializer, FastListSerializer, LeaderboardSerializer
+
+
+def async_api_view(view):
+    """
+    Allow only GET, hand the view a DRF ``Request`` for its query
+    parameters, render its return value as JSON and turn API exceptions
+    into the error responses DRF would send.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return JsonResponse(
+                {'detail': f'Method "{request.method}" not allowed.'},
+                status=status.HTTP_405_METHOD_NOT_ALLOWED,
+            )
+        try:
+            return JsonResponse(await view(Request(request), *args, **kwargs), safe=False)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            return JsonResponse(detail, status=exc.status_code, safe=False)
+    return wrapper
+
+
+@async_api_view
+async def activity_list(request):
+    """Activities newest first, filtered and paginated like ``/api/activities/``."""
+    db = get_async_db()
+    params = request.query_params
+    team_members = None
+    if params.get('team_id'):
+        cursor = db.users.find({'team_id': params['team_id']}, {'_id': 1})
+        team_members = {str(user['_id']) for user in await cursor.to_list(length=None)}
+    query = activity_filter(params, team_members)
+    if await sync_to_async(archive.reads_archive)(params):
+        paginator = ActivityPagination()
+        serializer = FastListSerializer(ActivitySerializer)
+        rows = await sync_to_async(paginator.paginate_documents)(
+            archive.find_activities, query, request, Activity, serializer.columns
+        )
+        return _page(paginator, serializer, rows)
+    return await _paginate(db.activities, query, request, ActivityPagination(), ActivitySerializer)
+
+
+@async_api_view
+async def leaderboard_list(request):
+    """Leaderboard entries by rank, paginated like ``/api/leaderboard/``."""
+    db = get_async_db()
+    return await _paginate(db.leaderboard, {}, request, LeaderboardPagination(), LeaderboardSerializer)
+
+
+@async_api_view
+async def stats(request):
+    """Activity totals from the rollups, like ``/api/stats/``."""
+    collection_name, query = rollups.stats_query(request.query_params)
+    cursor = get_async_db()[collection_name].find(query).sort('bucket_start', 1)
+    return rollups.summarize_stats(query, await cursor.to_list(length=None))
+
+
+async def _paginate(collection, query, request, paginator, serializer_class):
+    serializer = FastListSerializer(serializer_class)
+    rows = await paginator.apaginate_collection(
+        collection, query, request, serializer_class.Meta.model, projection=serializer.columns
+    )
+    return _page(paginator, serializer, rows)
+
+
+def _page(paginator, serializer, rows):
+    rows = [{column: row.get(column) for column in serializer.columns} for row in rows]
+    return {'next': paginator.get_next_link(), 'results': serializer.to_representation(rows)}
@@ -0,0 +1,120 @@
+"""
+Pluggable response caches for conditional GET.
+
+Keys are strong ETags derived from the request and the versions of the
+collections a view reads, so an entry never needs invalidating: once a
+write bumps a version, its old entries are simply no longer requested
+and fall out of the cache through LRU eviction.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_cache = None
+
+
+def get_response_cache():
+    """Return the response cache configured by ``settings.RESPONSE_CACHE``."""
+    global _cache
+    if _cache is None:
+        config = settings.RESPONSE_CACHE
+        _cache = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _cache
+
+
+class LocMemResponseCache:
+    """In-process LRU cache bounded by the number of entries."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileResponseCache:
+    """
+    Cache shared by the processes of one host, stored as one file per
+    entry. Recency is tracked through file modification times and the
+    least recently used files are removed once ``max_entries`` is exceeded.
+    """
+
+    def __init__(self, location, max_entries=1000):
+        self.location = location
+        self.max_entries = max_entries
+        os.makedirs(location, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.location, hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as handle:
+                value = pickle.load(handle)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as handle:
+            pickle.dump(value, handle, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+        self._cull()
+
+    def clear(self):
+        for entry in self._entries():
+            _remove(entry.path)
+
+    def _entries(self):
+        with os.scandir(self.location) as entries:
+            return [entry for entry in entries if entry.name.endswith('.cache')]
+
+    def _cull(self):
+        entries = self._entries()
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        entries.sort(key=_modified)
+        for entry in entries[:excess]:
+            _remove(entry.path)
+
+
+def _modified(entry):
+    try:
+        return entry.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,141 @@
+"""
+Admin changelists for collections too large for the stock ModelAdmin.
+
+``LargeCollectionAdmin`` pages with the keyset cursors of the API (one
+indexed range query per page instead of a count plus a skip), reports
+the unfiltered size from ``estimated_document_count`` and counts filtered
+lists only up to ``count_limit``. Searches are case-sensitive prefix
+matches, which Mongo serves from an index on the searched field (the
+term is matched literally, see ``Prefix``), and ``DistinctValuesFilter``
+builds its choices from a cached ``distinct``.
+"""
+import re
+
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.db.models import F, Lookup, Q
+
+from .mongo import get_db
+
+CURSOR_VAR = 'cursor'
+DISTINCT_CACHE_PREFIX = 'octofit:admin:distinct'
+
+
+class Prefix(Lookup):
+    """
+    Case-sensitive prefix match that takes the term literally. djongo turns
+    ``startswith`` into a ``$regex`` without escaping the term, and reads
+    ``%`` as a wildcard, so the term is regex-escaped here instead.
+    """
+    lookup_name = 'prefix'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        pattern = re.escape(self.rhs).replace('%', r'\x25') + '%'
+        return f'{lhs} LIKE %s', [*lhs_params, pattern]
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList paged by cursor, following ``model_admin.keyset_pagination_class``."""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        pagination = self.model_admin.keyset_pagination_class()
+        queryset = self.queryset.order_by(*pagination.ordering)
+        # Dropped from the params so filter and search links start over.
+        self.cursor = self.params.pop(CURSOR_VAR, None)
+        if self.cursor:
+            try:
+                position = pagination.parse_cursor(self.cursor, self.model)
+            except Exception:
+                raise IncorrectLookupParameters
+            queryset = queryset.filter(pagination.keyset_filter(position))
+
+        rows = list(queryset[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        self.next_url = None
+        if len(rows) > self.list_per_page:
+            self.next_url = self.get_query_string({CURSOR_VAR: pagination.encode_cursor(self.result_list[-1])})
+        self.first_url = self.get_query_string(remove=[CURSOR_VAR]) if self.cursor else None
+
+        self.full_result_count = get_db()[self.model._meta.db_table].estimated_document_count()
+        if self.has_active_filters or self.query:
+            matched = len(self.queryset.values_list('pk', flat=True)[:self.model_admin.count_limit + 1])
+            self.result_count = min(matched, self.model_admin.count_limit)
+            self.result_count_capped = matched > self.model_admin.count_limit
+        else:
+            self.result_count = self.full_result_count
+            self.result_count_capped = False
+        self.show_full_result_count = True
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = None
+
+
+class LargeCollectionAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin for collections with millions of documents. Subclasses set
+    ``keyset_pagination_class`` to the API pagination of the collection;
+    its ordering replaces column sorting.
+    """
+    keyset_pagination_class = None
+    count_limit = 1000
+    choices_timeout = 600
+    list_per_page = 100
+    sortable_by = ()
+    change_list_template = 'admin/octofit_tracker/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        condition = Q()
+        for field in self.get_search_fields(request):
+            condition |= Q(Prefix(F(field), term))
+        return queryset.filter(condition), False
+
+
+class DistinctValuesFilter(admin.SimpleListFilter):
+    """
+    Exact-match filter whose choices are the distinct values of ``source``
+    (``(collection, field)``, by default the filtered field itself), cached
+    for the admin's ``choices_timeout``. Create one with ``on()``.
+    """
+    field = None
+    source = None
+
+    @classmethod
+    def on(cls, field, title=None, source=None):
+        return type(f'{field.title().replace("_", "")}Filter', (cls,), {
+            'field': field,
+            'parameter_name': field,
+            'title': title or field.replace('_', ' '),
+            'source': source,
+        })
+
+    def lookups(self, request, model_admin):
+        collection, field = self.source or (
+            model_admin.model._meta.db_table, model_admin.model._meta.get_field(self.field).column
+        )
+        key = f'{DISTINCT_CACHE_PREFIX}:{collection}:{field}'
+        values = cache.get(key)
+        if values is None:
+            values = sorted(value for value in get_db()[collection].distinct(field) if value not in (None, ''))
+            cache.set(key, values, model_admin.choices_timeout)
+        return [(value, value) for value in values]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(**{self.field: self.value()})
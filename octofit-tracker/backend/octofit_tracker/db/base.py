@@ -0,0 +1,28 @@
+"""
+djongo backend that uses the process-wide MongoClient.
+
+djongo closes its MongoClient whenever a Django connection is closed,
+which with ``CONN_MAX_AGE = 0`` happens after every request and drops
+the pooled sockets of every thread. This backend takes its client from
+``octofit_tracker.mongo.get_client`` and leaves it open, so all threads
+share one warm pool.
+"""
+from djongo import base
+
+from ..mongo import get_client
+from .creation import DatabaseCreation
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, connection_params):
+        name = connection_params.pop('name')
+        enforce_schema = connection_params.pop('enforce_schema')
+        self.client_connection = get_client()
+        database = self.client_connection[name]
+        self.djongo_connection = base.DjongoClient(database, enforce_schema)
+        return database
+
+    def _close(self):
+        """Keep the shared client and its pool open for the other connections."""
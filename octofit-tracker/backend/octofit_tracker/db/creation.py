@@ -0,0 +1,56 @@
+"""
+Test database creation for the octofit_tracker backend.
+
+djongo clones the test database for ``manage.py test --parallel`` by
+shelling out to mongodump and mongorestore and then closes its client;
+this copies the collections and their indexes through the shared client
+instead, which also works with the in-memory client of the test settings.
+"""
+from djongo import creation
+
+from ..mongo import get_client
+
+INDEX_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def take_snapshot(db):
+    """Return {collection: (indexes, documents)} for every collection of ``db``."""
+    return {
+        name: (db[name].index_information(), list(db[name].find()))
+        for name in db.list_collection_names()
+    }
+
+
+def restore_snapshot(db, snapshot):
+    """
+    Bring ``db`` back to a snapshot: collections created since are dropped,
+    the others refilled and, if their indexes changed, rebuilt.
+    """
+    for name in db.list_collection_names():
+        if name not in snapshot:
+            db.drop_collection(name)
+    for name, (indexes, documents) in snapshot.items():
+        collection = db[name]
+        if collection.index_information() == indexes:
+            collection.delete_many({})
+        else:
+            db.drop_collection(name)
+            db.create_collection(name)
+            for index_name, index in indexes.items():
+                if index_name != '_id_':
+                    options = {option: index[option] for option in INDEX_OPTIONS if option in index}
+                    collection.create_index(index['key'], name=index_name, **options)
+        if documents:
+            collection.insert_many(documents)
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        client = get_client()
+        source = client[self.connection.settings_dict['NAME']]
+        target = client[self.get_test_db_clone_settings(suffix)['NAME']]
+        if keepdb and target.list_collection_names():
+            return
+        client.drop_database(target.name)
+        restore_snapshot(target, take_snapshot(source))
@@ -0,0 +1,144 @@
+"""
+Activity deduplication.
+
+Every activity created through the API carries a ``dedupe_key``: a hash
+of the client's idempotency key when one is sent, otherwise a canonical
+hash of ``(user_id, activity_type, date, duration, distance)``. The key
+is uniquely indexed, so a retried upload finds the activity it already
+created instead of inserting it again, in the activities collection or,
+once archived, through the archive's key index.
+``deduplicate_activities`` brings activities stored before the key
+existed in line.
+"""
+import hashlib
+import itertools
+import json
+from datetime import timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from . import archive, leaderboard, rollups, versions
+from .mongo import get_db
+
+DEDUPE_FIELDS = {'user_id': 1, 'activity_type': 1, 'date': 1, 'duration': 1, 'distance': 1,
+                 'calories': 1, 'dedupe_key': 1}
+
+
+def activity_key(document, idempotency_key=None):
+    """Return the dedupe key of an activity document."""
+    if idempotency_key:
+        return _digest('key', document['user_id'], idempotency_key)
+    return content_key(document)
+
+
+def content_key(document):
+    """Hash the fields that identify an activity, as Mongo stores them."""
+    distance = document.get('distance')
+    return _digest(
+        'content',
+        document['user_id'],
+        document['activity_type'],
+        _canonical_date(document['date']),
+        int(document['duration']),
+        None if distance is None else float(distance),
+    )
+
+
+def upsert_activity(document):
+    """
+    Insert an activity document unless one with the same dedupe_key
+    exists. Returns (_id, created).
+    """
+    collection = get_db().activities
+    key = document['dedupe_key']
+    archived = archive.archived_ids([key])
+    if archived:
+        return archived[key], False
+    try:
+        result = collection.update_one({'dedupe_key': key}, {'$setOnInsert': document}, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent upload of the same activity won the race.
+        result = None
+    if result is not None and result.upserted_id is not None:
+        return result.upserted_id, True
+    return existing_ids([key])[key], False
+
+
+def existing_ids(keys):
+    """Return {dedupe_key: _id} for the stored activities, live or archived, with the given keys."""
+    keys = set(keys)
+    cursor = get_db().activities.find({'dedupe_key': {'$in': list(keys)}}, {'dedupe_key': 1})
+    found = {document['dedupe_key']: document['_id'] for document in cursor}
+    if len(found) < len(keys):
+        found.update(archive.archived_ids(keys - found.keys()))
+    return found
+
+
+def deduplicate_activities(batch_size=1000, dry_run=False):
+    """
+    Remove duplicate activities and key the ones kept.
+
+    Activities are streamed in ``user_id_date`` index order, so duplicates
+    (same dedupe key, or same content for unkeyed activities) arrive next
+    to each other; the oldest of each set is kept. Deletes and key updates
+    are written every ``batch_size`` activities, and the removed ones are
+    folded out of the leaderboard and rollups. Returns (scanned, removed,
+    keyed).
+    """
+    db = get_db()
+    cursor = (
+        db.activities.find({}, DEDUPE_FIELDS)
+        .sort([('user_id', 1), ('date', -1)])
+        .batch_size(batch_size)
+    )
+    scanned = removed = keyed = 0
+    duplicates = []
+    updates = []
+    for _, group in itertools.groupby(cursor, key=lambda document: (document['user_id'], document['date'])):
+        by_key = {}
+        for document in group:
+            scanned += 1
+            by_key.setdefault(document.get('dedupe_key') or content_key(document), []).append(document)
+        for key, documents in by_key.items():
+            documents.sort(key=lambda document: document['_id'])
+            duplicates.extend(documents[1:])
+            if documents[0].get('dedupe_key') != key:
+                updates.append(UpdateOne({'_id': documents[0]['_id']}, {'$set': {'dedupe_key': key}}))
+        # Flush between groups so a group's deletes precede its key updates.
+        if len(duplicates) + len(updates) >= batch_size:
+            removed += len(duplicates)
+            keyed += len(updates)
+            if not dry_run:
+                _write(db, duplicates, updates)
+            duplicates, updates = [], []
+    removed += len(duplicates)
+    keyed += len(updates)
+    if not dry_run:
+        _write(db, duplicates, updates)
+    return scanned, removed, keyed
+
+
+def _write(db, duplicates, updates):
+    if duplicates:
+        db.activities.delete_many({'_id': {'$in': [document['_id'] for document in duplicates]}})
+        deltas = leaderboard.batch_deltas(duplicates)
+        leaderboard.apply_deltas({
+            user_id: (-points, -activities) for user_id, (points, activities) in deltas.items()
+        })
+        rollups.apply_activity_changes(removed=duplicates)
+    if updates:
+        db.activities.bulk_write(updates, ordered=False)
+    if duplicates or updates:
+        versions.bump('activities')
+
+
+def _canonical_date(value):
+    # Mongo keeps naive UTC datetimes with millisecond precision.
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000).isoformat()
+
+
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
@@ -0,0 +1,49 @@
+"""
+Embedding of referenced users and teams (``?expand=user,team``).
+
+References are stored as bare string ids. Expansions are resolved for a
+whole page with at most one ``$in`` query per referenced collection (for
+the ids missing from the document cache), so the number of queries does
+not grow with the number of rows.
+"""
+from . import lookups
+
+USER_FIELDS = ('name', 'team_id')
+TEAM_FIELDS = ('name',)
+
+
+def expand_rows(rows, expansions, user_field=None, team_field=None):
+    """
+    Add ``user`` and/or ``team`` objects to representation rows in place.
+
+    ``user_field`` names the row key holding a user id and ``team_field``
+    the key holding a team id. Without a ``team_field`` the team is
+    reached through the row's user. Missing references embed as None.
+    """
+    users = {}
+    if user_field and ('user' in expansions or ('team' in expansions and not team_field)):
+        users = fetch_documents('users', {row.get(user_field) for row in rows}, USER_FIELDS)
+    teams = {}
+    if 'team' in expansions:
+        if team_field:
+            team_ids = {row.get(team_field) for row in rows}
+        else:
+            team_ids = {user['team_id'] for user in users.values()}
+        teams = fetch_documents('teams', team_ids, TEAM_FIELDS)
+
+    for row in rows:
+        user = users.get(row.get(user_field)) if user_field else None
+        if 'user' in expansions:
+            row['user'] = user
+        if 'team' in expansions:
+            team_id = row.get(team_field) if team_field else (user or {}).get('team_id')
+            row['team'] = teams.get(team_id)
+    return rows
+
+
+def fetch_documents(collection_name, ids, fields):
+    """Return {id: {'id': id, field: value, ...}} for the given ids through the document cache."""
+    return {
+        document_id: {'id': document_id, **{field: document.get(field) for field in fields}}
+        for document_id, document in lookups.get_documents(collection_name, ids).items()
+    }
@@ -0,0 +1,51 @@
+"""
+Streaming serialization of raw activity documents.
+
+Rows are encoded one at a time from a batched server-side cursor, so the
+memory used by an export does not depend on how many rows it returns.
+"""
+import csv
+import json
+
+from .mongo import format_datetime
+
+EXPORT_FIELDS = ['id', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date']
+EXPORT_PROJECTION = {field: 1 for field in EXPORT_FIELDS if field != 'id'}
+
+
+def export_row(document):
+    """Convert an activity document into the ActivitySerializer output shape."""
+    return {
+        'id': str(document['_id']),
+        'user_id': document.get('user_id'),
+        'activity_type': document.get('activity_type'),
+        'duration': document.get('duration'),
+        'distance': document.get('distance'),
+        'calories': document.get('calories'),
+        'date': format_datetime(document.get('date')),
+    }
+
+
+def iter_ndjson(cursor):
+    for document in cursor:
+        yield json.dumps(export_row(document)) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() returns the written value."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(cursor):
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for document in cursor:
+        yield writer.writerow(export_row(document))
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', iter_ndjson),
+    'csv': ('text/csv', iter_csv),
+}
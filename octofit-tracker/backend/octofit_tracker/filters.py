@@ -0,0 +1,94 @@
+"""
+Translation of activity query parameters into a single Mongo filter.
+
+The parameters ``user_id``, ``team_id``, ``activity_type``,
+``date__gte``, ``date__lte`` and ``min_duration`` are parsed once into
+conditions, which render either as a raw Mongo filter for pymongo or as
+ORM lookups that djongo turns into the same filter.
+"""
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connection
+from rest_framework.exceptions import ValidationError
+
+from .models import Activity
+from .mongo import get_db
+
+MONGO_OPERATORS = {'in': '$in', 'gte': '$gte', 'lte': '$lte'}
+
+
+def activity_conditions(params, team_members=None):
+    """
+    Parse activity query parameters into (field, lookup, value) conditions.
+    ``team_members`` are the ids of the ``team_id`` members when the caller
+    has already looked them up; otherwise they are queried.
+    """
+    conditions = []
+    user_ids = None
+    if params.get('user_id'):
+        user_ids = {params['user_id']}
+    if params.get('team_id'):
+        members = team_members if team_members is not None else team_member_ids(params['team_id'])
+        user_ids = members if user_ids is None else user_ids & members
+    if user_ids is not None:
+        conditions.append(('user_id', 'in', sorted(user_ids)))
+
+    if params.get('activity_type'):
+        conditions.append(('activity_type', 'exact', params['activity_type']))
+    for param, lookup in (('date__gte', 'gte'), ('date__lte', 'lte')):
+        if params.get(param):
+            conditions.append(('date', lookup, _parse(param, 'date', params[param])))
+    if params.get('min_duration'):
+        conditions.append(('duration', 'gte', _parse('min_duration', 'duration', params['min_duration'])))
+    return conditions
+
+
+def activity_filter(params, team_members=None):
+    """Build the raw Mongo filter for the activity query parameters."""
+    query = {}
+    for field, lookup, value in activity_conditions(params, team_members):
+        value = _db_value(field, value)
+        if lookup == 'exact':
+            query[field] = value
+        else:
+            query.setdefault(field, {})[MONGO_OPERATORS[lookup]] = value
+    return query
+
+
+def activity_lookups(params):
+    """Build ORM filter keyword arguments for the activity query parameters."""
+    return {f'{field}__{lookup}': value for field, lookup, value in activity_conditions(params)}
+
+
+def date_range(params):
+    """Return the Mongo range operators for ``date__gte``/``date__lte``."""
+    dates = {}
+    for param, operator in (('date__gte', '$gte'), ('date__lte', '$lte')):
+        if params.get(param):
+            dates[operator] = db_datetime(param, params[param])
+    return dates
+
+
+def team_member_ids(team_id):
+    """Return the ids of all users in a team with one query."""
+    cursor = get_db().users.find({'team_id': team_id}, {'_id': 1})
+    return {str(user['_id']) for user in cursor}
+
+
+def db_datetime(param, value):
+    """Parse a date or datetime parameter into the value stored by djongo."""
+    return _db_value('date', _parse(param, 'date', value))
+
+
+def _parse(param, field_name, value):
+    field = Activity._meta.get_field(field_name)
+    try:
+        return field.to_python(value)
+    except DjangoValidationError as exc:
+        raise ValidationError({param: exc.messages})
+
+
+def _db_value(field_name, value):
+    field = Activity._meta.get_field(field_name)
+    if isinstance(value, list):
+        return [field.get_db_prep_value(item, connection) for item in value]
+    return field.get_db_prep_value(value, connection)
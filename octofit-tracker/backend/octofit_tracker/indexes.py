@@ -0,0 +1,130 @@
+"""
+Declarative Mongo index management.
+
+Each model lists its indexes in a ``mongo_indexes`` attribute next to its
+fields. ``sync_indexes`` makes the collections match those declarations
+and ``explain_queries`` reports which index serves each API query.
+"""
+from datetime import datetime
+
+from django.apps import apps
+from pymongo import ASCENDING, DESCENDING
+
+# Representative queries issued by the API: (label, collection, filter, sort, limit).
+API_QUERIES = [
+    ('activities list page', 'activities', {}, [('date', DESCENDING), ('_id', DESCENDING)], 50),
+    ('activities by user', 'activities', {'user_id': 'user'}, [('date', DESCENDING)], 50),
+    ('activities export by date', 'activities',
+     {'date': {'$gte': datetime(1970, 1, 1)}}, [('date', ASCENDING), ('_id', ASCENDING)], 0),
+    ('leaderboard list page', 'leaderboard', {}, [('rank', ASCENDING), ('_id', ASCENDING)], 50),
+    ('leaderboard entry by user', 'leaderboard', {'user_id': 'user'}, None, 1),
+    ('leaderboard rank count', 'leaderboard', {'total_points': {'$gt': 0}}, None, 0),
+    ('team members', 'users', {'team_id': 'team'}, None, 0),
+    ('admin activities by type', 'activities',
+     {'activity_type': 'Running'}, [('date', DESCENDING), ('_id', DESCENDING)], 100),
+    ('admin activities by user prefix', 'activities',
+     {'user_id': {'$regex': '^user'}}, [('date', DESCENDING), ('_id', DESCENDING)], 100),
+    ('admin leaderboard by name prefix', 'leaderboard',
+     {'user_name': {'$regex': '^name'}}, [('rank', ASCENDING), ('_id', ASCENDING)], 100),
+    ('user stats', 'activity_rollups',
+     {'user_id': 'user', 'granularity': 'day'}, [('bucket_start', ASCENDING)], 0),
+    ('team stats', 'team_rollups',
+     {'team_id': 'team', 'granularity': 'day'}, [('bucket_start', ASCENDING)], 0),
+]
+
+
+def declared_indexes():
+    """Return {collection: [IndexModel]} for every octofit model."""
+    return {
+        model._meta.db_table: list(getattr(model, 'mongo_indexes', []))
+        for model in apps.get_app_config('octofit_tracker').get_models()
+    }
+
+
+def create_declared_indexes(collection, collection_name):
+    """
+    Build the indexes declared for ``collection_name`` on ``collection``,
+    e.g. on a staging collection before it is renamed into place.
+    """
+    models = declared_indexes().get(collection_name)
+    if models:
+        collection.create_indexes(models)
+
+
+def index_signature(key, unique=False):
+    """Identify an index by its key pattern and uniqueness, ignoring its name."""
+    pattern = tuple(
+        (field, int(direction) if isinstance(direction, (int, float)) else direction)
+        for field, direction in key
+    )
+    return pattern, bool(unique)
+
+
+def sync_indexes(db, drop=True, dry_run=False):
+    """
+    Create missing declared indexes and drop undeclared ones.
+
+    Existing indexes that match a declaration by key pattern and
+    uniqueness are kept whatever their name. Returns a list of
+    (action, collection, index name) tuples.
+    """
+    actions = []
+    for collection_name, models in declared_indexes().items():
+        collection = db[collection_name]
+        existing = {
+            index_signature(info['key'], info.get('unique')): name
+            for name, info in collection.index_information().items()
+            if name != '_id_'
+        }
+        declared = {}
+        for index in models:
+            document = index.document
+            declared[index_signature(document['key'].items(), document.get('unique'))] = index
+
+        missing = [index for signature, index in declared.items() if signature not in existing]
+        for index in missing:
+            actions.append(('create', collection_name, index.document['name']))
+        if missing and not dry_run:
+            collection.create_indexes(missing)
+
+        if drop:
+            for signature, name in existing.items():
+                if signature not in declared:
+                    actions.append(('drop', collection_name, name))
+                    if not dry_run:
+                        collection.drop_index(name)
+    return actions
+
+
+def explain_queries(db):
+    """
+    Explain every query in API_QUERIES. Returns a list of dicts with the
+    label, collection, the winning plan's index (None for a collection
+    scan) and the documents examined for the documents returned.
+    """
+    report = []
+    for label, collection_name, query, sort, limit in API_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        explain = cursor.explain()
+        stats = explain.get('executionStats', {})
+        report.append({
+            'label': label,
+            'collection': collection_name,
+            'index': _winning_index(explain['queryPlanner']['winningPlan']),
+            'docs_examined': stats.get('totalDocsExamined'),
+            'returned': stats.get('nReturned'),
+        })
+    return report
+
+
+def _winning_index(plan):
+    """Return the index name used by a plan, or None for a collection scan."""
+    while plan is not None:
+        if plan.get('stage') == 'IXSCAN':
+            return plan.get('indexName')
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return None
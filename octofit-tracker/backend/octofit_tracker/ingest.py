@@ -0,0 +1,313 @@
+"""
+Write-behind activity ingestion.
+
+With ``settings.ACTIVITY_INGEST['MODE'] = 'buffered'`` a created activity
+is validated, given its ObjectId and put on an in-process bounded buffer;
+the API answers 202 straight away. A background thread writes the buffer
+with ``insert_many`` whenever it holds ``BATCH_SIZE`` activities or
+``FLUSH_INTERVAL`` seconds have passed, then folds the batch into the
+leaderboard, rollups and team standings like a bulk upload.
+
+An upload of an activity that is still queued (same ``dedupe_key``)
+gets the queued activity back. A full buffer raises ``BufferFull`` so
+the API can push back; batches awaiting a retry count towards it. The
+buffer is drained when the process exits. With ``SPOOL_DIR`` set, every
+accepted activity is first appended to a per-process spool file in that
+directory. The spool is moved aside as a segment when its activities
+are flushed and the segment is removed once written; segments and
+spools left behind by a crashed process are replayed when a flusher
+starts. Replays are idempotent because ObjectIds are assigned on
+submission.
+
+A batch that fails to write (e.g. while Mongo is unreachable) stays in
+memory and is retried with exponential backoff, up to
+``MAX_RETRY_DELAY`` seconds apart, until it is written.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo.errors import BulkWriteError
+
+from . import leaderboard, rollups, versions
+from .mongo import get_db
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+MAX_RETRY_DELAY = 30
+SPOOL_FILE = re.compile(r'^activities-(?P<pid>\d+)(-[0-9a-f]+\.flushing|\.spool)$')
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+class BufferFull(Exception):
+    """The ingestion buffer is at capacity."""
+
+
+def buffered():
+    """Whether activity creation goes through the write-behind buffer."""
+    return getattr(settings, 'ACTIVITY_INGEST', {}).get('MODE', 'sync') == 'buffered'
+
+
+def get_buffer():
+    """Return this process's ActivityBuffer, configured by ``settings.ACTIVITY_INGEST``."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                options = settings.ACTIVITY_INGEST
+                _buffer = ActivityBuffer(
+                    max_size=options.get('MAX_SIZE', 10000),
+                    batch_size=options.get('BATCH_SIZE', 500),
+                    flush_interval=options.get('FLUSH_INTERVAL', 1.0),
+                    spool_dir=options.get('SPOOL_DIR'),
+                    fsync=options.get('FSYNC', False),
+                )
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def record_inserted(documents):
+    """Fold newly inserted activity documents into the derived collections."""
+    versions.bump('activities')
+    leaderboard.apply_deltas(leaderboard.batch_deltas(documents))
+    rollups.apply_activity_changes(added=documents)
+
+
+class ActivityBuffer:
+    """Bounded in-process buffer of activity documents with a flusher thread."""
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0, spool_dir=None, fsync=False):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self.fsync = fsync
+        self._items = []
+        # Activities accepted and not yet written, queued or awaiting a retry.
+        self._held = 0
+        # dedupe_key -> the activities accepted and not yet written.
+        self._keys = {}
+        # (documents, spool segment) of the batches waiting to be retried;
+        # only touched by the flusher thread.
+        self._retries = []
+        self._condition = threading.Condition()
+        self._closing = False
+        self._thread = None
+        self._spool = None
+
+    def submit(self, document):
+        """
+        Queue an activity document and return it, or the queued activity
+        document with the same ``dedupe_key``. Raises BufferFull when the
+        buffer is at capacity.
+        """
+        document.setdefault('_id', ObjectId())
+        key = document.get('dedupe_key')
+        with self._condition:
+            if key is not None and key in self._keys:
+                return self._keys[key]
+            if self._closing:
+                raise BufferFull('The ingestion buffer is shutting down.')
+            if self._held >= self.max_size:
+                raise BufferFull('The ingestion buffer is full.')
+            if self.spool_dir:
+                self._append_to_spool(document)
+            self._items.append(document)
+            self._held += 1
+            if key is not None:
+                self._keys[key] = document
+            if len(self._items) >= self.batch_size:
+                self._condition.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='activity-flusher', daemon=True)
+                self._thread.start()
+        return document
+
+    def pending(self):
+        """Number of accepted activities not yet written."""
+        with self._condition:
+            return self._held
+
+    def close(self, timeout=30):
+        """Stop accepting activities and wait for the buffer to drain."""
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error('Closed with %d buffered activities unwritten', self.pending())
+
+    def _run(self):
+        self._replay_spool()
+        delay = self.flush_interval
+        while True:
+            with self._condition:
+                if self._retries:
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait_for(
+                        lambda: self._closing or len(self._items) >= self.batch_size, self.flush_interval
+                    )
+                batch, self._items = self._items, []
+                segment = self._rotate_spool() if batch else None
+                closing = self._closing
+            pending, self._retries = self._retries, []
+            if batch:
+                pending.append((batch, segment))
+            for documents, path in pending:
+                self._flush(documents, path)
+            delay = min(delay * 2, MAX_RETRY_DELAY) if self._retries else self.flush_interval
+            if closing and not pending:
+                return
+
+    def _flush(self, documents, segment=None):
+        """Write documents, keeping the ones that failed (and their segment) for a retry."""
+        failed = self._write(documents)
+        if failed:
+            self._retries.append((failed, segment))
+        elif segment:
+            _remove(segment)
+        unwritten = {document['_id'] for document in failed}
+        self._forget([document for document in documents if document['_id'] not in unwritten])
+
+    def _forget(self, documents):
+        """Release written documents and their queued keys; later uploads find them stored."""
+        with self._condition:
+            self._held -= len(documents)
+            for document in documents:
+                queued = self._keys.get(document.get('dedupe_key'))
+                if queued is not None and queued['_id'] == document['_id']:
+                    del self._keys[document['dedupe_key']]
+
+    def _write(self, documents):
+        """Insert documents in batches; returns the documents of the batches that failed."""
+        failed = []
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            try:
+                inserted = insert_activities(batch)
+            except Exception:
+                logger.exception('Failed to write %d buffered activities; will retry', len(batch))
+                failed.extend(batch)
+                continue
+            try:
+                if inserted:
+                    record_inserted(inserted)
+            except Exception:
+                # The activities are stored; the rebuild commands repair derived data.
+                logger.exception('Failed to record %d buffered activities', len(inserted))
+        return failed
+
+    @property
+    def spool_path(self):
+        return os.path.join(self.spool_dir, f'activities-{os.getpid()}.spool')
+
+    def _segment_path(self):
+        return os.path.join(self.spool_dir, f'activities-{os.getpid()}-{ObjectId()}.flushing')
+
+    def _append_to_spool(self, document):
+        if self._spool is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            if os.path.exists(self.spool_path):
+                # Left behind by an earlier process with the same pid.
+                os.replace(self.spool_path, self._segment_path())
+            self._spool = open(self.spool_path, 'a', encoding='utf-8')
+        self._spool.write(json.dumps(_encode(document)) + '\n')
+        self._spool.flush()
+        if self.fsync:
+            os.fsync(self._spool.fileno())
+
+    def _rotate_spool(self):
+        """
+        Move the spool aside as the segment holding exactly the activities
+        being flushed (submissions append and enqueue under the same lock).
+        """
+        if self._spool is None:
+            return None
+        self._spool.close()
+        self._spool = None
+        segment = self._segment_path()
+        os.replace(self.spool_path, segment)
+        return segment
+
+    def _replay_spool(self):
+        """Write the spools and segments left behind by processes that are gone."""
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return
+        for name in sorted(os.listdir(self.spool_dir)):
+            match = SPOOL_FILE.match(name)
+            if match is None:
+                continue
+            pid = int(match['pid'])
+            path = os.path.join(self.spool_dir, name)
+            if pid == os.getpid() and path == self.spool_path:
+                continue
+            if pid != os.getpid() and _process_alive(pid):
+                continue
+            try:
+                with open(path, encoding='utf-8') as handle:
+                    documents = [_decode(json.loads(line)) for line in handle if line.strip()]
+            except FileNotFoundError:
+                continue
+            logger.info('Replaying %d spooled activities from %s', len(documents), path)
+            with self._condition:
+                self._held += len(documents)
+            self._flush(documents, path)
+
+
+def insert_activities(documents, collection=None):
+    """
+    insert_many into ``collection`` (the activities by default) that skips
+    documents already present (by _id), so batches can be replayed.
+    Returns the documents actually inserted.
+    """
+    collection = get_db().activities if collection is None else collection
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as exc:
+        failed = {error['index'] for error in exc.details['writeErrors']}
+        if any(error['code'] != DUPLICATE_KEY for error in exc.details['writeErrors']):
+            logger.error('Rejected activities: %s', exc.details['writeErrors'])
+        return [document for index, document in enumerate(documents) if index not in failed]
+    return documents
+
+
+def _encode(document):
+    return {
+        key: str(value) if isinstance(value, ObjectId) else value.isoformat() if isinstance(value, datetime) else value
+        for key, value in document.items()
+    }
+
+
+def _decode(data):
+    data['_id'] = ObjectId(data['_id'])
+    data['date'] = datetime.fromisoformat(data['date'])
+    return data
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,74 @@
+"""
+In-memory Mongo-compatible clients for the test settings.
+
+``InMemoryMongoClient`` (mongomock) and ``AsyncInMemoryMongoClient``
+(mongomock-motor) stand in for pymongo's and motor's clients through
+``settings.MONGO_CLIENT_CLASS`` and ``settings.ASYNC_MONGO_CLIENT_CLASS``.
+Every client of a process shares one server store, so djongo, the direct
+pymongo code and the async views see the same data, as they would with
+one mongod. The store lives in the process: forked test workers inherit
+a copy of it, spawned ones would start empty.
+"""
+import mongomock
+import mongomock_motor
+from mongomock import collection
+from mongomock.store import ServerStore
+
+# Pool options mongomock-motor does not accept.
+POOL_OPTIONS = ('maxPoolSize', 'minPoolSize', 'maxIdleTimeMS', 'waitQueueTimeoutMS')
+
+_store = ServerStore()
+
+
+class InMemoryMongoClient(mongomock.MongoClient):
+    """mongomock client backed by the process-wide store."""
+    in_process = True
+
+    def __init__(self, *args, **kwargs):
+        kwargs.pop('_store', None)
+        super().__init__(*args, _store=_store, **kwargs)
+
+
+class AsyncInMemoryMongoClient(mongomock_motor.AsyncMongoMockClient):
+    """mongomock-motor client backed by the process-wide store."""
+    in_process = True
+
+    def __init__(self, *args, **kwargs):
+        for option in POOL_OPTIONS:
+            kwargs.pop(option, None)
+        super().__init__(mock_mongo_client=InMemoryMongoClient(*args, **kwargs))
+
+
+# mongomock drops partialFilterExpression from create_indexes and checks a
+# new unique index against every document; honour it like mongod, so the
+# partial unique index on activities.dedupe_key can be built.
+_create_index = collection.Collection.create_index
+
+
+def create_index(self, key_or_list, cache_for=300, session=None, **kwargs):
+    if kwargs.get('unique') and kwargs.get('partialFilterExpression') is not None:
+        if kwargs.get('name') in self._store.indexes:
+            return kwargs['name']
+        name = _create_index(self, key_or_list, cache_for, session, **dict(kwargs, unique=False))
+        self._store.indexes[name]['unique'] = True
+        return name
+    return _create_index(self, key_or_list, cache_for, session, **kwargs)
+
+
+def create_indexes(self, indexes, session=None):
+    return [
+        self.create_index(
+            index.document['key'].items(),
+            session=session,
+            name=index.document.get('name'),
+            unique=index.document.get('unique', False),
+            sparse=index.document.get('sparse', False),
+            expireAfterSeconds=index.document.get('expireAfterSeconds'),
+            partialFilterExpression=index.document.get('partialFilterExpression'),
+        )
+        for index in indexes
+    ]
+
+
+collection.Collection.create_index = create_index
+collection.Collection.create_indexes = create_indexes
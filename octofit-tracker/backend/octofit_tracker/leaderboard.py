@@ -0,0 +1,264 @@
+"""
+Leaderboard maintenance and ranking.
+
+Points are the sum of a user's activity calories. Ranks are either
+competition ranks (1 + number of entries with strictly more points, the
+default) or dense ranks (1 + number of distinct higher scores), chosen by
+``settings.LEADERBOARD_RANKING``. Under competition ranking a score change
+is applied by shifting only the entries whose points lie between the old
+and the new score. Dense ranks only change when a score value appears or
+disappears: the entries below it shift by one, or, when one value
+replaces another, the entries between the two. ``recompute_ranks`` ranks
+the whole leaderboard at once.
+"""
+import itertools
+
+from django.conf import settings
+from pymongo import ReturnDocument, UpdateMany
+
+from .indexes import create_declared_indexes
+from . import archive, lookups, versions
+from .mongo import get_db
+
+RANK_METHODS = ('competition', 'dense')
+
+
+def activity_deltas(old=None, new=None):
+    """
+    Return the {user_id: (points, activities)} deltas caused by replacing
+    the activity ``old`` with ``new``. Either side may be None.
+    """
+    deltas = {}
+    if old is not None:
+        points, count = deltas.get(old['user_id'], (0, 0))
+        deltas[old['user_id']] = (points - old['calories'], count - 1)
+    if new is not None:
+        points, count = deltas.get(new['user_id'], (0, 0))
+        deltas[new['user_id']] = (points + new['calories'], count + 1)
+    return {user_id: delta for user_id, delta in deltas.items() if delta != (0, 0)}
+
+
+def batch_deltas(activities):
+    """Return the summed {user_id: (points, activities)} deltas for new activities."""
+    deltas = {}
+    for activity in activities:
+        points, count = deltas.get(activity['user_id'], (0, 0))
+        deltas[activity['user_id']] = (points + activity['calories'], count + 1)
+    return deltas
+
+
+def apply_activity_change(old=None, new=None):
+    """Apply the leaderboard deltas for a single activity write."""
+    apply_deltas(activity_deltas(old, new))
+
+
+def apply_deltas(deltas):
+    """Apply {user_id: (points, activities)} deltas to the leaderboard."""
+    method = settings.LEADERBOARD_RANKING
+    if method not in RANK_METHODS:
+        raise ValueError(f'Unknown ranking method "{method}".')
+    db = get_db()
+    for user_id, (points, activities) in deltas.items():
+        _apply_delta(db, user_id, points, activities, method)
+    if deltas:
+        versions.bump('leaderboard')
+
+
+def recompute_ranks(method=None):
+    """
+    Rank every entry with one aggregation and one bulk_write.
+
+    A $group per distinct score, sorted by points, yields the rank of each
+    score; one update_many per score then sets it on the entries that do
+    not already hold it. Returns the number of entries whose rank changed.
+    """
+    method = method or settings.LEADERBOARD_RANKING
+    if method not in RANK_METHODS:
+        raise ValueError(f'Unknown ranking method "{method}".')
+    db = get_db()
+    pipeline = [
+        {'$group': {'_id': '$total_points', 'entries': {'$sum': 1}}},
+        {'$sort': {'_id': -1}},
+    ]
+    requests = []
+    position = 1
+    for dense_rank, group in enumerate(db.leaderboard.aggregate(pipeline, allowDiskUse=True), start=1):
+        rank = dense_rank if method == 'dense' else position
+        requests.append(UpdateMany(
+            {'total_points': group['_id'], 'rank': {'$ne': rank}}, {'$set': {'rank': rank}}
+        ))
+        position += group['entries']
+    if not requests:
+        return 0
+    modified = db.leaderboard.bulk_write(requests, ordered=False).modified_count
+    versions.bump('leaderboard')
+    return modified
+
+
+def rebuild(batch_size=1000):
+    """
+    Recompute every leaderboard entry from the activities collection.
+
+    Totals come from one $group aggregation plus the archived totals of
+    each user; users without activities get a zero-point entry. Entries
+    are written to a staging collection that is renamed over
+    ``leaderboard`` and then ranked by ``recompute_ranks``. Returns the
+    number of entries written.
+    """
+    db = get_db()
+    users = {str(user['_id']): user for user in db.users.find({}, {'name': 1, 'team_id': 1})}
+    teams = {str(team['_id']): team.get('name') or '' for team in db.teams.find({}, {'name': 1})}
+    pipeline = [
+        {'$group': {
+            '_id': '$user_id',
+            'total_points': {'$sum': '$calories'},
+            'total_activities': {'$sum': 1},
+        }},
+    ]
+    archived = archive.archived_totals()
+    archived_only_users = (
+        {'_id': user_id, 'total_points': 0, 'total_activities': 0} for user_id in archived
+    )
+    zero_point_users = ({'_id': user_id, 'total_points': 0, 'total_activities': 0} for user_id in users)
+
+    staging = db['leaderboard_rebuild']
+    staging.drop()
+    seen = set()
+    batch = []
+    written = 0
+    groups = itertools.chain(
+        db.activities.aggregate(pipeline, allowDiskUse=True), archived_only_users, zero_point_users
+    )
+    for group in groups:
+        user_id = group['_id']
+        if user_id in seen:
+            continue
+        seen.add(user_id)
+        archived_points, archived_activities = archived.get(user_id, (0, 0))
+        user = users.get(user_id, {})
+        team_id = user.get('team_id') or ''
+        batch.append({
+            'user_id': user_id,
+            'user_name': user.get('name') or '',
+            'team_id': team_id,
+            'team_name': teams.get(team_id, ''),
+            'total_points': group['total_points'] + archived_points,
+            'total_activities': group['total_activities'] + archived_activities,
+            'rank': 0,
+        })
+        if len(batch) >= batch_size:
+            staging.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        staging.insert_many(batch, ordered=False)
+        written += len(batch)
+
+    if written:
+        create_declared_indexes(staging, 'leaderboard')
+        staging.rename('leaderboard', dropTarget=True)
+        recompute_ranks()
+    else:
+        db.leaderboard.delete_many({})
+        versions.bump('leaderboard')
+    return written
+
+
+def _apply_delta(db, user_id, points, activities, method):
+    before = db.leaderboard.find_one_and_update(
+        {'user_id': user_id},
+        {'$inc': {'total_points': points, 'total_activities': activities}},
+        projection={'total_points': 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        db.leaderboard.update_one(
+            {'user_id': user_id},
+            {
+                '$inc': {'total_points': points, 'total_activities': activities},
+                '$setOnInsert': _entry_names(user_id),
+            },
+            upsert=True,
+        )
+        old_points = None
+    else:
+        old_points = before['total_points']
+    if method == 'dense':
+        _fix_dense_ranks(db, user_id, old_points, (old_points or 0) + points)
+    else:
+        _fix_ranks(db, user_id, old_points, (old_points or 0) + points)
+
+
+def _fix_ranks(db, user_id, old_points, new_points):
+    """Shift the ranks of entries scored between old_points and new_points."""
+    others = {'user_id': {'$ne': user_id}}
+    if old_points is None:
+        db.leaderboard.update_many(
+            {**others, 'total_points': {'$lt': new_points}}, {'$inc': {'rank': 1}}
+        )
+    elif new_points > old_points:
+        db.leaderboard.update_many(
+            {**others, 'total_points': {'$gte': old_points, '$lt': new_points}},
+            {'$inc': {'rank': 1}},
+        )
+    elif new_points < old_points:
+        db.leaderboard.update_many(
+            {**others, 'total_points': {'$gte': new_points, '$lt': old_points}},
+            {'$inc': {'rank': -1}},
+        )
+    rank = 1 + db.leaderboard.count_documents({'total_points': {'$gt': new_points}})
+    db.leaderboard.update_one({'user_id': user_id}, {'$set': {'rank': rank}})
+
+
+def _fix_dense_ranks(db, user_id, old_points, new_points):
+    """
+    Shift dense ranks for a score moving from old_points to new_points:
+    only a score value that appears or disappears changes other ranks.
+    """
+    others = {'user_id': {'$ne': user_id}}
+
+    def held(points):
+        return db.leaderboard.count_documents({**others, 'total_points': points}, limit=1) > 0
+
+    moved = new_points != old_points
+    removed = moved and old_points is not None and not held(old_points)
+    added = moved and not held(new_points)
+    if added and removed:
+        # One value replaces the other: only the entries between them move.
+        if new_points > old_points:
+            shift, scores = 1, {'$gt': old_points, '$lt': new_points}
+        else:
+            shift, scores = -1, {'$gt': new_points, '$lt': old_points}
+    elif added:
+        shift, scores = 1, {'$lt': new_points}
+    elif removed:
+        shift, scores = -1, {'$lt': old_points}
+    else:
+        shift = 0
+    if shift:
+        db.leaderboard.update_many({**others, 'total_points': scores}, {'$inc': {'rank': shift}})
+
+    # The rank of an equal score, else one below the next higher score.
+    same = db.leaderboard.find_one({**others, 'total_points': new_points}, {'rank': 1})
+    if same is not None:
+        rank = same['rank']
+    else:
+        above = db.leaderboard.find_one(
+            {**others, 'total_points': {'$gt': new_points}}, {'rank': 1}, sort=[('total_points', 1)]
+        )
+        rank = 1 if above is None else above['rank'] + 1
+    db.leaderboard.update_one({'user_id': user_id}, {'$set': {'rank': rank}})
+
+
+def _entry_names(user_id):
+    """Resolve the denormalized user and team names for a new entry."""
+    names = {'user_name': '', 'team_id': '', 'team_name': ''}
+    user = lookups.get_users([user_id]).get(user_id)
+    if user is None:
+        return names
+    names['user_name'] = user.get('name') or ''
+    names['team_id'] = user.get('team_id') or ''
+    team = lookups.get_teams([names['team_id']]).get(names['team_id'])
+    if team is not None:
+        names['team_name'] = team.get('name') or ''
+    return names
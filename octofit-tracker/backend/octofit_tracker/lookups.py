@@ -0,0 +1,192 @@
+"""
+Read-through cache for User and Team documents looked up by id.
+
+``get_users`` and ``get_teams`` serve ids from the backend configured by
+``settings.DOCUMENT_CACHE`` and fetch the misses with one ``$in`` query.
+Entries expire after a timeout and are invalidated by the post_save and
+post_delete signals of the models (see ``signals.py``).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .mongo import get_db
+
+# Fields cached per collection; lookups return {'id': ..., field: value}.
+CACHED_FIELDS = {
+    'users': ('name', 'email', 'team_id'),
+    'teams': ('name', 'description'),
+}
+
+_cache = None
+
+
+def get_document_cache():
+    """Return the document cache configured by ``settings.DOCUMENT_CACHE``."""
+    global _cache
+    if _cache is None:
+        config = settings.DOCUMENT_CACHE
+        _cache = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _cache
+
+
+def get_users(ids):
+    """Return {user_id: user} for the given string ids; unknown ids are left out."""
+    return get_documents('users', ids)
+
+
+def get_teams(ids):
+    """Return {team_id: team} for the given string ids; unknown ids are left out."""
+    return get_documents('teams', ids)
+
+
+def get_documents(collection_name, ids):
+    ids = {value for value in ids if isinstance(value, str) and value}
+    if not ids:
+        return {}
+    cache = get_document_cache()
+    documents = cache.get_many(collection_name, ids)
+    missing = ids - documents.keys()
+    if missing:
+        fetched = _fetch(collection_name, missing)
+        cache.set_many(collection_name, fetched)
+        documents.update(fetched)
+    return documents
+
+
+def invalidate(collection_name, document_id):
+    get_document_cache().delete(collection_name, str(document_id))
+
+
+def _fetch(collection_name, ids):
+    object_ids = []
+    for value in ids:
+        try:
+            object_ids.append(ObjectId(value))
+        except (InvalidId, TypeError):
+            continue
+    if not object_ids:
+        return {}
+    fields = CACHED_FIELDS[collection_name]
+    cursor = get_db()[collection_name].find({'_id': {'$in': object_ids}}, dict.fromkeys(fields, 1))
+    return {
+        str(document['_id']): {'id': str(document['_id']), **{field: document.get(field) for field in fields}}
+        for document in cursor
+    }
+
+
+class DocumentCache:
+    """Hit and miss counting shared by the document cache backends."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, requested, found):
+        self.hits += found
+        self.misses += requested - found
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class LocMemDocumentCache(DocumentCache):
+    """In-process LRU cache bounded by entries, with a timeout per entry."""
+
+    def __init__(self, max_entries=10000, timeout=300):
+        super().__init__()
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, collection_name, ids):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for document_id in ids:
+                key = (collection_name, document_id)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires, document = entry
+                if expires <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[document_id] = document
+            self.record(len(ids), len(found))
+        return found
+
+    def set_many(self, collection_name, documents):
+        expires = time.monotonic() + self.timeout
+        with self._lock:
+            for document_id, document in documents.items():
+                key = (collection_name, document_id)
+                self._entries[key] = (expires, document)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, collection_name, document_id):
+        with self._lock:
+            self._entries.pop((collection_name, document_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {**super().stats(), 'entries': len(self._entries), 'max_entries': self.max_entries}
+
+
+class SharedDocumentCache(DocumentCache):
+    """
+    Cache stored in a Django cache alias. With a shared cache (e.g. Redis
+    or Memcached) an invalidation in one worker is seen by all of them.
+    Hit rates are counted per process.
+    """
+
+    key_prefix = 'octofit:document'
+
+    def __init__(self, alias='default', timeout=300):
+        super().__init__()
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, collection_name, document_id):
+        return f'{self.key_prefix}:{collection_name}:{document_id}'
+
+    def get_many(self, collection_name, ids):
+        keys = {self._key(collection_name, document_id): document_id for document_id in ids}
+        found = {keys[key]: document for key, document in self.cache.get_many(list(keys)).items()}
+        self.record(len(ids), len(found))
+        return found
+
+    def set_many(self, collection_name, documents):
+        self.cache.set_many(
+            {self._key(collection_name, document_id): document for document_id, document in documents.items()},
+            self.timeout,
+        )
+
+    def delete(self, collection_name, document_id):
+        self.cache.delete(self._key(collection_name, document_id))
+
+    def clear(self):
+        """Clear the whole cache alias, which should be dedicated to documents."""
+        self.cache.clear()
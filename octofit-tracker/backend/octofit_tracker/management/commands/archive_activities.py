@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from octofit_tracker import archive
+
+
+class Command(BaseCommand):
+    help = 'Move old activities to the archive, keeping leaderboard and rollup totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after-days', type=int, default=None,
+                            help='Archive activities older than this many days (default: settings)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Number of activities moved per batch (default: settings)')
+        parser.add_argument('--every', type=int, default=None, metavar='SECONDS',
+                            help='Keep running, archiving again every SECONDS seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            moved = archive.archive_activities(after_days=options['after_days'], batch_size=options['batch_size'])
+            self.stdout.write(f'Activities archived: {moved} (watermark {archive.watermark():%Y-%m-%d})')
+            if options['every'] is None:
+                break
+            time.sleep(options['every'])
+        self.stdout.write(self.style.SUCCESS('Activities successfully archived!'))
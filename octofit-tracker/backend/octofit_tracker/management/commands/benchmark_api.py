@@ -0,0 +1,298 @@
+from bson import ObjectId
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from octofit_tracker.mongo import get_db
+from datetime import datetime
+from io import StringIO
+import itertools
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ACTIVITIES_PER_USER = 20
+BULK_SIZE = 100
+# Ids per route that the detail requests pick from.
+MAX_IDS = 1000
+ROUTES = ['users', 'teams', 'activities', 'leaderboard', 'workouts']
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class InProcessTransport:
+    """Sends requests through Django's test client, one client per thread."""
+
+    target = 'in-process'
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+        if method == 'GET':
+            return client.get(path).status_code
+        return client.post(path, json.dumps(body), content_type='application/json').status_code
+
+    def ids(self, route):
+        return [str(document['_id']) for document in get_db()[route].find({}, {'_id': 1}).limit(MAX_IDS)]
+
+
+class HttpTransport:
+    """Sends requests to a running server."""
+
+    def __init__(self, base_url):
+        self.target = self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+    def ids(self, route):
+        request = urllib.request.Request(
+            f'{self.base_url}/api/{route}/?fields=id&page_size={MAX_IDS}', headers={'Accept': 'application/json'},
+        )
+        with urllib.request.urlopen(request) as response:
+            data = json.load(response)
+        rows = data['results'] if isinstance(data, dict) else data
+        return [row['id'] for row in rows]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark list, detail, create and bulk requests on every API route at several '
+        'data scales and concurrency levels. In process, each scale is seeded through populate_db '
+        'into a test database that is destroyed afterwards. A server given with --url is '
+        'benchmarked on the data it already has, unless --seed-local reseeds the configured '
+        'database for it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,100000,1000000',
+                            help='Comma-separated numbers of activities to seed (ignored when not seeding)')
+        parser.add_argument('--concurrency', default='1,4,16',
+                            help='Comma-separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per endpoint and concurrency level')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for data and requests')
+        parser.add_argument('--workers', type=int, default=1, help='populate_db worker processes')
+        parser.add_argument('--url', default=None,
+                            help='Base URL of a running server (default: in-process test client)')
+        parser.add_argument('--seed-local', action='store_true',
+                            help='With --url, reseed the configured database, e.g. when the server shares it')
+        parser.add_argument('--output', default=None,
+                            help='JSON results file (default: benchmarks/<commit>.json)')
+        parser.add_argument('--compare', default=None,
+                            help='Previous JSON results file to compare against')
+
+    def handle(self, *args, **options):
+        scales = _int_list(options['scales'], '--scales')
+        concurrency_levels = _int_list(options['concurrency'], '--concurrency')
+        commit = _git_commit()
+        if options['url']:
+            transport = HttpTransport(options['url'])
+            if options['seed_local']:
+                self.stderr.write(self.style.WARNING(
+                    f'Every scale drops and reseeds the "{get_db().name}" database.'))
+            else:
+                # No scales: the server's own data, labelled as scale None.
+                scales = [None]
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'Benchmarking the existing data of {transport.target}...'))
+            results = self.measure(transport, scales, concurrency_levels, options['seed_local'], options)
+        else:
+            # Seeded into a throwaway database, never the configured one.
+            transport = InProcessTransport()
+            database = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self.measure(transport, scales, concurrency_levels, True, options)
+            finally:
+                connection.creation.destroy_test_db(database, verbosity=0)
+
+        output = options['output'] or os.path.join('benchmarks', f'{commit or "results"}.json')
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as handle:
+            json.dump({
+                'commit': commit,
+                'created': timezone.now().isoformat(),
+                'target': transport.target,
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'results': results,
+            }, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def measure(self, transport, scales, concurrency_levels, seed, options):
+        """Run every scenario at each scale and concurrency level, seeding each scale if ``seed``."""
+        results = []
+        for scale in scales:
+            if seed:
+                users = max(1, scale // ACTIVITIES_PER_USER)
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'Seeding {users * ACTIVITIES_PER_USER} activities for {users} users...'))
+                call_command(
+                    'populate_db', users=users, teams=10, activities_per_user=ACTIVITIES_PER_USER,
+                    seed=options['seed'], workers=options['workers'], stdout=StringIO(),
+                )
+            scenarios = self.scenarios(transport, random.Random(options['seed']))
+            for concurrency in concurrency_levels:
+                for name, method, make_request in scenarios:
+                    result = self.run(transport, method, make_request, concurrency, options['requests'])
+                    result.update(scale=scale, endpoint=name, concurrency=concurrency)
+                    results.append(result)
+                    self.stdout.write(
+                        f'{scale or "existing":>8} {name:<20} c={concurrency:<3} '
+                        f'p50 {result["p50_ms"]:8.2f} ms  p95 {result["p95_ms"]:8.2f} ms  '
+                        f'p99 {result["p99_ms"]:8.2f} ms  {result["rps"]:8.1f} req/s'
+                        + (f'  {result["errors"]} errors' if result['errors'] else '')
+                    )
+        return results
+
+    def scenarios(self, transport, rng):
+        """
+        Return (name, method, make_request) for every route, where
+        make_request() returns the path and body of the next request.
+        Detail requests pick from ids listed through ``transport``.
+        """
+        ids = {route: transport.ids(route) for route in ROUTES}
+        user_ids = ids['users']
+        counter = itertools.count()
+        token = f'{int(time.time())}-{rng.randrange(10 ** 6)}'
+
+        def activity():
+            return {
+                'user_id': rng.choice(user_ids),
+                'activity_type': rng.choice(['Running', 'Cycling', 'Yoga']),
+                'duration': rng.randint(30, 120),
+                'distance': round(rng.uniform(2, 15), 2),
+                'calories': rng.randint(150, 1400),
+                'date': datetime.utcnow().isoformat() + 'Z',
+            }
+
+        payloads = {
+            'users': lambda n: {'name': f'Bench User {n}', 'email': f'bench-{token}-{n}@octofit.example'},
+            'teams': lambda n: {'name': f'Bench Team {token}-{n}', 'description': 'Benchmark team'},
+            'activities': lambda n: activity(),
+            'leaderboard': lambda n: {
+                'user_id': str(ObjectId()), 'user_name': f'Bench User {n}',
+                'team_id': 'bench', 'team_name': 'Bench Team', 'total_points': 0, 'total_activities': 0,
+            },
+            'workouts': lambda n: {
+                'name': f'Bench Workout {n}', 'category': 'Cardio', 'difficulty': 'Medium',
+                'duration': 30, 'calories_burn': 300, 'description': 'Benchmark workout',
+            },
+        }
+
+        scenarios = []
+        for route in ROUTES:
+            scenarios.append((f'{route} list', 'GET', lambda route=route: (f'/api/{route}/', None)))
+            if ids[route]:
+                scenarios.append((
+                    f'{route} detail', 'GET',
+                    lambda route=route: (f'/api/{route}/{rng.choice(ids[route])}/', None),
+                ))
+            scenarios.append((
+                f'{route} create', 'POST',
+                lambda route=route: (f'/api/{route}/', payloads[route](next(counter))),
+            ))
+        if user_ids:
+            scenarios.append((
+                'activities bulk', 'POST',
+                lambda: ('/api/activities/bulk/', [activity() for _ in range(BULK_SIZE)]),
+            ))
+        return scenarios
+
+    def run(self, transport, method, make_request, concurrency, count):
+        """Send ``count`` requests from ``concurrency`` threads and summarize latencies."""
+        requests = [make_request() for _ in range(count)]
+
+        def send(request):
+            path, body = request
+            start = time.perf_counter()
+            status_code = transport.request(method, path, body)
+            return time.perf_counter() - start, status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(send, requests))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency * 1000 for latency, _ in samples)
+        return {
+            'method': method,
+            'requests': count,
+            'errors': sum(1 for _, status_code in samples if status_code >= 400),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'rps': round(count / elapsed, 1),
+        }
+
+    def compare(self, path, results):
+        """Print the p95 and throughput change against a previous run."""
+        with open(path) as handle:
+            baseline = json.load(handle)
+        previous = {
+            (row['scale'], row['endpoint'], row['concurrency']): row for row in baseline['results']
+        }
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Compared with {baseline.get("commit") or path}:'))
+        for row in results:
+            before = previous.get((row['scale'], row['endpoint'], row['concurrency']))
+            if before is None:
+                continue
+            p95_change = _change(before['p95_ms'], row['p95_ms'])
+            rps_change = _change(before['rps'], row['rps'])
+            line = (f'{row["scale"] or "existing":>8} {row["endpoint"]:<20} c={row["concurrency"]:<3} '
+                    f'p95 {p95_change:+7.1f}%  req/s {rps_change:+7.1f}%')
+            self.stdout.write(self.style.WARNING(line) if p95_change > 10 else line)
+
+
+def _int_list(value, option):
+    try:
+        numbers = [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise CommandError(f'{option} must be a comma-separated list of integers')
+    if not numbers or min(numbers) < 1:
+        raise CommandError(f'{option} must list positive integers')
+    return numbers
+
+
+def _change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from octofit_tracker.models import Activity
+from octofit_tracker.serializers import ActivitySerializer, FastListSerializer
+from bson import ObjectId
+from datetime import timedelta
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compare ActivitySerializer with FastListSerializer on in-memory rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of activities per run')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs (best is reported)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic rows')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        rows = [
+            {
+                '_id': ObjectId(),
+                'user_id': str(ObjectId()),
+                'activity_type': rng.choice(['Running', 'Cycling', 'Yoga']),
+                'duration': rng.randint(30, 120),
+                'distance': round(rng.uniform(2, 15), 2),
+                'calories': rng.randint(150, 1400),
+                'date': now - timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+            }
+            for _ in range(options['rows'])
+        ]
+        instances = [Activity(**row) for row in rows]
+        fast = FastListSerializer(ActivitySerializer)
+
+        slow_output = ActivitySerializer(instances, many=True).data
+        fast_output = fast.to_representation(rows)
+        if [dict(item) for item in slow_output] != fast_output:
+            self.stderr.write(self.style.ERROR('Outputs differ!'))
+            return
+
+        timings = {}
+        for label, render in (
+            ('ActivitySerializer', lambda: ActivitySerializer(instances, many=True).data),
+            ('FastListSerializer', lambda: fast.to_representation(rows)),
+        ):
+            best = float('inf')
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                render()
+                best = min(best, time.perf_counter() - start)
+            timings[label] = best
+            self.stdout.write(f'{label:<20} {best * 1000:8.1f} ms for {len(rows)} rows')
+
+        speedup = timings['ActivitySerializer'] / timings['FastListSerializer']
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {speedup:.1f}x'))
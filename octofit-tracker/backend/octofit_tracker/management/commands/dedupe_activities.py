@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from octofit_tracker import dedupe
+
+
+class Command(BaseCommand):
+    help = 'Remove duplicate activities and set the dedupe key on the ones kept'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of deletes and key updates written per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the duplicates without removing them')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Deduplicating activities...')
+        scanned, removed, keyed = dedupe.deduplicate_activities(
+            batch_size=options['batch_size'], dry_run=options['dry_run']
+        )
+        dry_run = options['dry_run']
+        self.stdout.write(f'Activities scanned: {scanned}')
+        self.stdout.write(f'{"Duplicates to remove" if dry_run else "Duplicates removed"}: {removed}')
+        self.stdout.write(f'{"Activities to key" if dry_run else "Activities keyed"}: {keyed}')
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS('Activities successfully deduplicated!'))
@@ -1,29 +1,112 @@
 from django.core.management.base import BaseCommand
+from django.db import connection
+from octofit_tracker import archive, indexes, leaderboard, lookups, rollups, versions
 from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
+from octofit_tracker.mongo import get_db, new_client
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+import multiprocessing
 import random
 
+ACTIVITY_TYPES = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing']
+DISTANCE_TYPES = ['Running', 'Cycling', 'Swimming']
+
+MARVEL_HEROES = [
+    ('Iron Man', 'tony.stark@marvel.com'),
+    ('Captain America', 'steve.rogers@marvel.com'),
+    ('Thor', 'thor.odinson@marvel.com'),
+    ('Black Widow', 'natasha.romanoff@marvel.com'),
+    ('Hulk', 'bruce.banner@marvel.com'),
+    ('Spider-Man', 'peter.parker@marvel.com'),
+]
+DC_HEROES = [
+    ('Batman', 'bruce.wayne@dc.com'),
+    ('Superman', 'clark.kent@dc.com'),
+    ('Wonder Woman', 'diana.prince@dc.com'),
+    ('The Flash', 'barry.allen@dc.com'),
+    ('Aquaman', 'arthur.curry@dc.com'),
+    ('Green Lantern', 'hal.jordan@dc.com'),
+]
+
+
+def generate_activities(user_index, user_id, seed, activities_per_user, end_date):
+    """
+    Generate one user's activity documents. Each user gets its own random
+    stream derived from the seed, so the output does not depend on how
+    users are split across worker processes.
+    """
+    rng = random.Random(seed * 1_000_003 + user_index)
+    count = activities_per_user if activities_per_user is not None else rng.randint(5, 15)
+    for _ in range(count):
+        activity_type = rng.choice(ACTIVITY_TYPES)
+        duration = rng.randint(30, 120)
+        yield {
+            'user_id': user_id,
+            'activity_type': activity_type,
+            'duration': duration,
+            'distance': round(rng.uniform(2, 15), 2) if activity_type in DISTANCE_TYPES else None,
+            'calories': duration * rng.randint(5, 12),
+            'date': end_date - timedelta(days=rng.randint(0, 30), minutes=rng.randint(0, 24 * 60 - 1)),
+        }
+
+
+def insert_activities(collection, users, seed, activities_per_user, end_date, batch_size):
+    """Insert the activities of (user_index, user_id) pairs in batches. Returns the count."""
+    batch = []
+    inserted = 0
+    for user_index, user_id in users:
+        for activity in generate_activities(user_index, user_id, seed, activities_per_user, end_date):
+            batch.append(activity)
+            if len(batch) >= batch_size:
+                collection.insert_many(batch, ordered=False)
+                inserted += len(batch)
+                batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def _insert_activities_worker(task):
+    """Worker process entry point; opens its own client after the fork."""
+    db_name, users, seed, activities_per_user, end_date, batch_size = task
+    client = new_client()
+    try:
+        return insert_activities(client[db_name].activities, users, seed, activities_per_user, end_date, batch_size)
+    finally:
+        client.close()
+
 
 class Command(BaseCommand):
     help = 'Populate the octofit_db database with test data'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=None,
+                            help='Generate this many synthetic users instead of the superhero roster')
+        parser.add_argument('--teams', type=int, default=2,
+                            help='Number of teams synthetic users are spread across (at least 2)')
+        parser.add_argument('--activities-per-user', type=int, default=None,
+                            help='Activities per user (default: random 5-15)')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed for reproducible data')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Documents per insert_many')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes generating activities in parallel')
+
+    def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting database population...'))
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        batch_size = options['batch_size']
+        db = get_db()
         
-        # Delete existing data using Django ORM
+        # Drop existing data; indexes are recreated once the data is loaded
         self.stdout.write('Deleting existing data...')
-        User.objects.all().delete()
-        Team.objects.all().delete()
-        Activity.objects.all().delete()
-        Leaderboard.objects.all().delete()
-        Workout.objects.all().delete()
-        
-        # Create unique index on email field
-        self.stdout.write('Creating unique index on email field...')
-        client = MongoClient('localhost', 27017)
-        db = client['octofit_db']
-        db.users.create_index([('email', 1)], unique=True)
+        for model in [User, Team, Activity, Leaderboard, Workout]:
+            db[model._meta.db_table].drop()
+        db.activity_rollups.drop()
+        db.team_rollups.drop()
+        archive.clear()
+        lookups.get_document_cache().clear()
         
         # Create Teams
         self.stdout.write('Creating teams...')
@@ -35,79 +118,48 @@ class Command(BaseCommand):
             name='Team DC',
             description='Justice League and DC heroes staying in shape!'
         )
+        teams = [team_marvel, team_dc]
         
-        # Create Users - Marvel Heroes
-        self.stdout.write('Creating Marvel heroes...')
-        marvel_users = [
-            User.objects.create(name='Iron Man', email='tony.stark@marvel.com', team_id=str(team_marvel._id)),
-            User.objects.create(name='Captain America', email='steve.rogers@marvel.com', team_id=str(team_marvel._id)),
-            User.objects.create(name='Thor', email='thor.odinson@marvel.com', team_id=str(team_marvel._id)),
-            User.objects.create(name='Black Widow', email='natasha.romanoff@marvel.com', team_id=str(team_marvel._id)),
-            User.objects.create(name='Hulk', email='bruce.banner@marvel.com', team_id=str(team_marvel._id)),
-            User.objects.create(name='Spider-Man', email='peter.parker@marvel.com', team_id=str(team_marvel._id)),
-        ]
-        
-        # Create Users - DC Heroes
-        self.stdout.write('Creating DC heroes...')
-        dc_users = [
-            User.objects.create(name='Batman', email='bruce.wayne@dc.com', team_id=str(team_dc._id)),
-            User.objects.create(name='Superman', email='clark.kent@dc.com', team_id=str(team_dc._id)),
-            User.objects.create(name='Wonder Woman', email='diana.prince@dc.com', team_id=str(team_dc._id)),
-            User.objects.create(name='The Flash', email='barry.allen@dc.com', team_id=str(team_dc._id)),
-            User.objects.create(name='Aquaman', email='arthur.curry@dc.com', team_id=str(team_dc._id)),
-            User.objects.create(name='Green Lantern', email='hal.jordan@dc.com', team_id=str(team_dc._id)),
-        ]
-        
-        all_users = marvel_users + dc_users
+        if options['users'] is None:
+            # Create Users - Marvel and DC Heroes
+            self.stdout.write('Creating Marvel heroes...')
+            marvel_users = [
+                User.objects.create(name=name, email=email, team_id=str(team_marvel._id))
+                for name, email in MARVEL_HEROES
+            ]
+            self.stdout.write('Creating DC heroes...')
+            dc_users = [
+                User.objects.create(name=name, email=email, team_id=str(team_dc._id))
+                for name, email in DC_HEROES
+            ]
+            user_ids = [str(user._id) for user in marvel_users + dc_users]
+        else:
+            for number in range(3, options['teams'] + 1):
+                teams.append(Team.objects.create(name=f'Team {number}', description=f'Synthetic team {number}'))
+            user_ids = self.create_synthetic_users(db, options['users'], teams, batch_size)
         
         # Create Activities
         self.stdout.write('Creating activities...')
-        activity_types = ['Running', 'Cycling', 'Swimming', 'Weightlifting', 'Yoga', 'Boxing']
-        for user in all_users:
-            for i in range(random.randint(5, 15)):
-                activity_type = random.choice(activity_types)
-                duration = random.randint(30, 120)
-                distance = round(random.uniform(2, 15), 2) if activity_type in ['Running', 'Cycling', 'Swimming'] else None
-                calories = duration * random.randint(5, 12)
-                date = datetime.now() - timedelta(days=random.randint(0, 30))
-                
-                Activity.objects.create(
-                    user_id=str(user._id),
-                    activity_type=activity_type,
-                    duration=duration,
-                    distance=distance,
-                    calories=calories,
-                    date=date
-                )
+        end_date = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        users = list(enumerate(user_ids))
+        activities_per_user = options['activities_per_user']
+        workers = max(1, min(options['workers'], len(users)))
+        if workers == 1:
+            insert_activities(db.activities, users, seed, activities_per_user, end_date, batch_size)
+        else:
+            db_name = connection.settings_dict['NAME']
+            chunks = [users[index::workers] for index in range(workers)]
+            tasks = [(db_name, chunk, seed, activities_per_user, end_date, batch_size) for chunk in chunks]
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                pool.map(_insert_activities_worker, tasks)
         
         # Create Leaderboard entries
         self.stdout.write('Creating leaderboard entries...')
-        for user in all_users:
-            user_activities = Activity.objects.filter(user_id=str(user._id))
-            total_points = sum(act.calories for act in user_activities)
-            total_activities = user_activities.count()
-            
-            # Determine team based on user membership
-            if user in marvel_users:
-                team = team_marvel
-            else:
-                team = team_dc
-            
-            Leaderboard.objects.create(
-                user_id=str(user._id),
-                user_name=user.name,
-                team_id=str(team._id),
-                team_name=team.name,
-                total_points=total_points,
-                total_activities=total_activities,
-                rank=0  # Will be calculated later
-            )
+        leaderboard.rebuild(batch_size=batch_size)
         
-        # Update ranks based on total points
-        leaderboard_entries = Leaderboard.objects.all().order_by('-total_points')
-        for idx, entry in enumerate(leaderboard_entries, start=1):
-            entry.rank = idx
-            entry.save()
+        # Build daily and weekly rollups
+        self.stdout.write('Building activity rollups...')
+        rollups.rebuild(batch_size=batch_size)
         
         # Create Workouts
         self.stdout.write('Creating personalized workouts...')
@@ -197,11 +249,37 @@ class Command(BaseCommand):
         for workout_data in workouts_data:
             Workout.objects.create(**workout_data)
         
+        # Create the indexes declared on the models
+        self.stdout.write('Syncing indexes...')
+        indexes.sync_indexes(db)
+        versions.bump(*indexes.declared_indexes())
+        
         # Statistics
         self.stdout.write(self.style.SUCCESS('\n=== Database Population Complete ==='))
-        self.stdout.write(f'Teams created: {Team.objects.count()}')
-        self.stdout.write(f'Users created: {User.objects.count()}')
-        self.stdout.write(f'Activities created: {Activity.objects.count()}')
-        self.stdout.write(f'Leaderboard entries: {Leaderboard.objects.count()}')
-        self.stdout.write(f'Workouts created: {Workout.objects.count()}')
+        self.stdout.write(f'Teams created: {db.teams.estimated_document_count()}')
+        self.stdout.write(f'Users created: {db.users.estimated_document_count()}')
+        self.stdout.write(f'Activities created: {db.activities.estimated_document_count()}')
+        self.stdout.write(f'Leaderboard entries: {db.leaderboard.estimated_document_count()}')
+        self.stdout.write(f'Workouts created: {db.workouts.estimated_document_count()}')
+        self.stdout.write(f'Seed: {seed}')
         self.stdout.write(self.style.SUCCESS('Database successfully populated with superhero data!'))
+    
+    def create_synthetic_users(self, db, count, teams, batch_size):
+        """Insert synthetic users spread round-robin across teams. Returns their ids."""
+        self.stdout.write(f'Creating {count} synthetic users...')
+        team_ids = [str(team._id) for team in teams]
+        user_ids = []
+        batch = []
+        created_at = datetime.utcnow()
+        for index in range(count):
+            batch.append({
+                'name': f'Athlete {index + 1}',
+                'email': f'athlete{index + 1}@octofit.example',
+                'team_id': team_ids[index % len(team_ids)],
+                'created_at': created_at,
+            })
+            if len(batch) >= batch_size or index == count - 1:
+                result = db.users.insert_many(batch, ordered=False)
+                user_ids.extend(str(user_id) for user_id in result.inserted_ids)
+                batch = []
+        return user_ids
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from octofit_tracker import leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recompute leaderboard ranks with one aggregation and one bulk write'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', choices=leaderboard.RANK_METHODS, default=None,
+                            help=f'Ranking method (default: {settings.LEADERBOARD_RANKING})')
+
+    def handle(self, *args, **options):
+        method = options['method'] or settings.LEADERBOARD_RANKING
+        self.stdout.write(f'Ranking leaderboard ({method})...')
+        changed = leaderboard.recompute_ranks(method)
+        self.stdout.write(self.style.SUCCESS(f'Ranks updated: {changed}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from octofit_tracker import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and weekly activity rollups from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rollup documents written per insert_many')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding activity rollups...')
+        user_rollups, team_rollups = rollups.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f'User rollups written: {user_rollups}')
+        self.stdout.write(f'Team rollups written: {team_rollups}')
+        self.stdout.write(self.style.SUCCESS('Rollups successfully rebuilt!'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from octofit_tracker import indexes
+from octofit_tracker.mongo import get_db
+
+
+class Command(BaseCommand):
+    help = 'Create missing and drop stale indexes declared by the octofit models'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the changes without applying them')
+        parser.add_argument('--keep-stale', action='store_true',
+                            help='Do not drop indexes that are no longer declared')
+        parser.add_argument('--no-explain', action='store_true',
+                            help='Skip the explain report of API queries')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        actions = indexes.sync_indexes(db, drop=not options['keep_stale'], dry_run=options['dry_run'])
+        if not actions:
+            self.stdout.write('Indexes are up to date.')
+        for action, collection, name in actions:
+            verb = f'Would {action}' if options['dry_run'] else action.capitalize()
+            self.stdout.write(f'{verb} index {collection}.{name}')
+
+        if options['no_explain']:
+            return
+        self.stdout.write(self.style.SUCCESS('\n=== Query Plans ==='))
+        for row in indexes.explain_queries(db):
+            if row['index']:
+                plan = self.style.SUCCESS(f"IXSCAN {row['index']}")
+            else:
+                plan = self.style.WARNING('COLLSCAN')
+            self.stdout.write(
+                f"{row['label']:<28} {row['collection']:<18} {plan} "
+                f"(examined {row['docs_examined']}, returned {row['returned']})"
+            )
@@ -1,4 +1,6 @@
 from djongo import models
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
 
 class User(models.Model):
     _id = models.ObjectIdField()
@@ -10,6 +12,11 @@ class User(models.Model):
     class Meta:
         db_table = 'users'
     
+    mongo_indexes = [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+        IndexModel([('team_id', ASCENDING)], name='team_id'),
+    ]
+    
     def __str__(self):
         return self.name
 
@@ -23,6 +30,10 @@ class Team(models.Model):
     class Meta:
         db_table = 'teams'
     
+    mongo_indexes = [
+        IndexModel([('name', ASCENDING)], name='name_unique', unique=True),
+    ]
+    
     def __str__(self):
         return self.name
 
@@ -35,10 +46,20 @@ class Activity(models.Model):
     distance = models.FloatField(null=True, blank=True)  # in km
     calories = models.IntegerField()
     date = models.DateTimeField()
+    dedupe_key = models.CharField(max_length=64, null=True, blank=True)  # see dedupe.py
     
     class Meta:
         db_table = 'activities'
     
+    mongo_indexes = [
+        IndexModel([('user_id', ASCENDING), ('date', DESCENDING)], name='user_id_date'),
+        IndexModel([('date', DESCENDING), ('_id', DESCENDING)], name='date_id'),
+        IndexModel([('activity_type', ASCENDING), ('date', DESCENDING), ('_id', DESCENDING)],
+                   name='activity_type_date_id'),
+        IndexModel([('dedupe_key', ASCENDING)], name='dedupe_key_unique', unique=True,
+                   partialFilterExpression={'dedupe_key': {'$type': 'string'}}),
+    ]
+    
     def __str__(self):
         return f"{self.activity_type} - {self.duration} mins"
 
@@ -56,6 +77,13 @@ class Leaderboard(models.Model):
     class Meta:
         db_table = 'leaderboard'
     
+    mongo_indexes = [
+        IndexModel([('user_id', ASCENDING)], name='user_id_unique', unique=True),
+        IndexModel([('total_points', DESCENDING)], name='total_points'),
+        IndexModel([('rank', ASCENDING), ('_id', ASCENDING)], name='rank_id'),
+        IndexModel([('user_name', ASCENDING)], name='user_name'),
+    ]
+    
     def __str__(self):
         return f"{self.user_name} - {self.total_points} points"
 
@@ -74,3 +102,47 @@ class Workout(models.Model):
     
     def __str__(self):
         return self.name
+
+
+class ActivityRollup(models.Model):
+    _id = models.ObjectIdField()
+    user_id = models.CharField(max_length=100)
+    granularity = models.CharField(max_length=10)  # 'day' or 'week'
+    bucket_start = models.DateTimeField()
+    duration = models.IntegerField(default=0)  # in minutes
+    distance = models.FloatField(default=0)  # in km
+    calories = models.IntegerField(default=0)
+    activities = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'activity_rollups'
+    
+    mongo_indexes = [
+        IndexModel([('user_id', ASCENDING), ('granularity', ASCENDING), ('bucket_start', ASCENDING)],
+                   name='user_id_granularity_bucket_start', unique=True),
+    ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.granularity} {self.bucket_start:%Y-%m-%d}"
+
+
+class TeamRollup(models.Model):
+    _id = models.ObjectIdField()
+    team_id = models.CharField(max_length=100)
+    granularity = models.CharField(max_length=10)  # 'day' or 'week'
+    bucket_start = models.DateTimeField()
+    duration = models.IntegerField(default=0)  # in minutes
+    distance = models.FloatField(default=0)  # in km
+    calories = models.IntegerField(default=0)
+    activities = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'team_rollups'
+    
+    mongo_indexes = [
+        IndexModel([('team_id', ASCENDING), ('granularity', ASCENDING), ('bucket_start', ASCENDING)],
+                   name='team_id_granularity_bucket_start', unique=True),
+    ]
+    
+    def __str__(self):
+        return f"{self.team_id} - {self.granularity} {self.bucket_start:%Y-%m-%d}"
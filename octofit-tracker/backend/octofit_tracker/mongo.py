@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+_client = None
+_client_lock = threading.Lock()
+
+# One motor client, and so one connection pool, per event loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def client_options():
+    """MongoClient options from ``DATABASES['default']['CLIENT']``."""
+    return dict(settings.DATABASES['default'].get('CLIENT', {}))
+
+
+def client_class():
+    """The MongoClient class, ``settings.MONGO_CLIENT_CLASS`` (pymongo's by default)."""
+    return import_string(getattr(settings, 'MONGO_CLIENT_CLASS', 'pymongo.MongoClient'))
+
+
+def get_client():
+    """
+    Return the process-wide MongoClient. djongo (through the
+    ``octofit_tracker.db`` backend) and direct pymongo code share it, so
+    each process has a single connection pool.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # djongo expects OrderedDict documents
+                _client = client_class()(connect=False, document_class=OrderedDict, **client_options())
+    return _client
+
+
+def get_db():
+    """Return the pymongo database behind the djongo connection."""
+    connection.ensure_connection()
+    return connection.connection
+
+
+def new_client():
+    """
+    Create a MongoClient with the shared client's options that has its own
+    pool, e.g. for use in a forked worker process.
+    """
+    return client_class()(**client_options())
+
+
+def get_async_db():
+    """
+    Return the motor database matching the djongo database, for use in
+    async views. Each event loop gets its own client and connection pool,
+    sized by ``settings.ASYNC_MONGO_CLIENT``.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        options = {**client_options(), **getattr(settings, 'ASYNC_MONGO_CLIENT', {})}
+        # Imported on first use: only the async views need motor.
+        motor_client = import_string(getattr(
+            settings, 'ASYNC_MONGO_CLIENT_CLASS', 'motor.motor_asyncio.AsyncIOMotorClient'
+        ))
+        client = _async_clients[loop] = motor_client(**options)
+    return client[connection.settings_dict['NAME']]
+
+
+def to_document(instance, add=True):
+    """Convert a model instance into the document djongo would write."""
+    document = {}
+    for field in instance._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        value = field.pre_save(instance, add=add)
+        document[field.column] = field.get_db_prep_save(value, connection)
+    return document
+
+
+def from_document(model, document):
+    """Build a ``model`` instance from a raw document, with naive datetimes read as UTC."""
+    values = {}
+    for field in model._meta.concrete_fields:
+        value = document.get(field.column)
+        if isinstance(value, datetime) and value.tzinfo is None and settings.USE_TZ:
+            value = value.replace(tzinfo=timezone.utc)
+        values[field.attname] = value
+    return model(**values)
+
+
+def format_datetime(value):
+    """Format a stored datetime (naive values are UTC) the way the API renders it."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    else:
+        value = value.astimezone(timezone.utc)
+    return value.isoformat().replace('+00:00', 'Z')
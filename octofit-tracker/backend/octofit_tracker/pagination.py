@@ -0,0 +1,185 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination over a compound sort key.
+
+    The cursor holds the sort key of the last row of the previous page, so
+    every page is a single indexed range query with a limit and never
+    skips over earlier rows.
+    """
+    ordering = ('-_id',)
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    async def apaginate_collection(self, collection, query, request, model, projection=None):
+        """
+        Async counterpart of ``paginate_queryset`` for a motor collection.
+        Accepts the same cursors and returns the raw documents of the page.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, model)
+        if position is not None:
+            query = {'$and': [query, self.mongo_filter(position, model)]}
+        cursor = collection.find(query, projection).sort(self.mongo_sort(model)).limit(self.page_size + 1)
+        rows = await cursor.to_list(length=None)
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def paginate_documents(self, find, query, request, model, fields=None):
+        """
+        Counterpart of ``apaginate_collection`` for a synchronous
+        ``find(query, sort, limit, fields)`` returning raw documents, such
+        as a find spanning several collections.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, model)
+        if position is not None:
+            query = {'$and': [query, self.mongo_filter(position, model)]}
+        rows = find(query, self.mongo_sort(model), self.page_size + 1, fields)
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            return self.parse_cursor(encoded, model)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row):
+        """Encode the sort key of ``row`` as the cursor of the rows after it."""
+        position = [_encode_value(_row_value(row, field.lstrip('-'))) for field in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def parse_cursor(self, encoded, model):
+        """Decode a cursor into the sort key values; raises on a malformed cursor."""
+        position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        if len(position) != len(self.ordering):
+            raise ValueError(self.invalid_cursor_message)
+        return [
+            model._meta.get_field(field.lstrip('-')).to_python(value)
+            for field, value in zip(self.ordering, position)
+        ]
+
+    def keyset_filter(self, position):
+        """
+        Build ``(k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...`` for the sort key,
+        with the comparison flipped for descending fields.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def mongo_filter(self, position, model):
+        """The keyset condition of ``keyset_filter`` as a raw Mongo filter."""
+        branches = []
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            model_field = model._meta.get_field(field.lstrip('-'))
+            value = model_field.get_db_prep_value(value, connection)
+            operator = '$lt' if field.startswith('-') else '$gt'
+            branches.append({**equal, model_field.column: {operator: value}})
+            equal[model_field.column] = value
+        return {'$or': branches}
+
+    def mongo_sort(self, model):
+        return [
+            (model._meta.get_field(field.lstrip('-')).column, -1 if field.startswith('-') else 1)
+            for field in self.ordering
+        ]
+
+
+class ActivityPagination(KeysetPagination):
+    """Newest activities first."""
+    ordering = ('-date', '-_id')
+
+
+class LeaderboardPagination(KeysetPagination):
+    """Best ranked entries first."""
+    ordering = ('rank', '_id')
+
+
+def _row_value(row, name):
+    """Read a sort key from a model instance or a ``values()`` row."""
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
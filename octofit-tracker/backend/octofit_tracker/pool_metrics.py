@@ -0,0 +1,149 @@
+"""
+MongoDB connection pool metrics.
+
+``PoolMetrics`` is a pymongo ``ConnectionPoolListener`` that tracks, per
+server address, the connections open and checked out and how long
+checkouts wait for a connection. It is registered once per process, so
+the numbers cover every client of the process (djongo, pymongo and
+motor) and are what ``/api/metrics/pool/`` reports.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from pymongo import monitoring
+
+# Checkout waits kept per address for the percentiles.
+RECENT_WAITS = 1000
+
+
+class _PoolStats:
+
+    def __init__(self, options=None):
+        self.options = dict(options or {})
+        self.open_connections = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = {}
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=RECENT_WAITS)
+        self.cleared = 0
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Collects pool usage and checkout wait times per server address."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.local = threading.local()
+
+    def _pool(self, address):
+        stats = self.pools.get(address)
+        if stats is None:
+            stats = self.pools[address] = _PoolStats()
+        return stats
+
+    def pool_created(self, event):
+        with self.lock:
+            self._pool(event.address).options.update(event.options or {})
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self._pool(event.address).cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self.lock:
+            self._pool(event.address).open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            self._pool(event.address).open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        # Checkouts complete on the thread that started them.
+        self.local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        wait = self._wait()
+        with self.lock:
+            stats = self._pool(event.address)
+            stats.checkout_failures[event.reason] = stats.checkout_failures.get(event.reason, 0) + 1
+            self._record_wait(stats, wait)
+
+    def connection_checked_out(self, event):
+        wait = self._wait()
+        with self.lock:
+            stats = self._pool(event.address)
+            stats.checkouts += 1
+            stats.in_use += 1
+            stats.max_in_use = max(stats.max_in_use, stats.in_use)
+            self._record_wait(stats, wait)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self._pool(event.address).in_use -= 1
+
+    def _wait(self):
+        started = getattr(self.local, 'started', None)
+        self.local.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def _record_wait(self, stats, wait):
+        stats.wait_total += wait
+        stats.wait_max = max(stats.wait_max, wait)
+        stats.recent_waits.append(wait)
+
+    def snapshot(self):
+        """Return the current metrics of every pool as JSON-serializable dicts."""
+        with self.lock:
+            pools = []
+            for (host, port), stats in sorted(self.pools.items()):
+                waits = sorted(stats.recent_waits)
+                attempts = stats.checkouts + sum(stats.checkout_failures.values())
+                pools.append({
+                    'address': f'{host}:{port}',
+                    'max_pool_size': stats.options.get('maxPoolSize'),
+                    'min_pool_size': stats.options.get('minPoolSize'),
+                    'open_connections': stats.open_connections,
+                    'in_use': stats.in_use,
+                    'max_in_use': stats.max_in_use,
+                    'checkouts': stats.checkouts,
+                    'checkout_failures': dict(stats.checkout_failures),
+                    'cleared': stats.cleared,
+                    'checkout_wait_ms': {
+                        'mean': _ms(stats.wait_total / attempts) if attempts else 0.0,
+                        'p50': _ms(_percentile(waits, 0.50)),
+                        'p95': _ms(_percentile(waits, 0.95)),
+                        'p99': _ms(_percentile(waits, 0.99)),
+                        'max': _ms(stats.wait_max),
+                    },
+                })
+        return {'pid': os.getpid(), 'pools': pools}
+
+
+pool_metrics = PoolMetrics()
+
+
+def register_pool_listener():
+    """Register the pool metrics for every MongoClient created afterwards."""
+    monitoring.register(pool_metrics)
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
@@ -0,0 +1,175 @@
+"""
+Per-request profiling.
+
+``ProfilingMiddleware`` samples a fraction of requests and collects, for
+each sampled request, the Mongo commands it issued (through a pymongo
+``CommandListener``), the time spent in serializers and the time spent
+rendering. The numbers are returned in a ``Server-Timing`` header and
+logged as one JSON line. Requests slower than the threshold are always
+logged, with the full profile when they were sampled.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('octofit_request_profile', default=None)
+
+
+class RequestProfile:
+    """Timings collected while one request is handled."""
+
+    def __init__(self):
+        self.commands = 0
+        self.command_time = 0.0
+        self.slowest_command = None
+        self.slowest_command_time = 0.0
+        self.timings = defaultdict(float)
+
+    def record_command(self, name, seconds):
+        self.commands += 1
+        self.command_time += seconds
+        if seconds > self.slowest_command_time:
+            self.slowest_command = name
+            self.slowest_command_time = seconds
+
+    def server_timing(self, total):
+        metrics = [
+            f'mongo;dur={_ms(self.command_time)};desc="{self.commands} commands"',
+            f'mongo-max;dur={_ms(self.slowest_command_time)};desc="{self.slowest_command or "-"}"',
+        ]
+        metrics.extend(f'{name};dur={_ms(seconds)}' for name, seconds in sorted(self.timings.items()))
+        metrics.append(f'total;dur={_ms(total)}')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'mongo_commands': self.commands,
+            'mongo_ms': _ms(self.command_time),
+            'mongo_slowest_ms': _ms(self.slowest_command_time),
+            'mongo_slowest_command': self.slowest_command,
+            **{f'{name}_ms': _ms(seconds) for name, seconds in sorted(self.timings.items())},
+        }
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Adds every Mongo command to the profile of the current request, if any."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.record_command(event.command_name, event.duration_micros / 1e6)
+
+
+def register_command_listener():
+    """Register the command timer for every MongoClient created afterwards."""
+    monitoring.register(CommandTimer())
+
+
+@contextmanager
+def timer(name):
+    """Add the duration of the block to ``name`` in the current profile."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[name] += time.perf_counter() - started
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of requests, configured by ``settings.PROFILING``:
+    ``SAMPLE_RATE`` is the fraction of requests profiled and
+    ``SLOW_REQUEST_MS`` the duration above which a request is logged as
+    slow whether or not it was sampled.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = getattr(settings, 'PROFILING', {})
+        self.sample_rate = options.get('SAMPLE_RATE', 0.0)
+        self.slow_request_ms = options.get('SLOW_REQUEST_MS')
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as a coroutine function so the async chain
+            # under ASGI does not hop to a thread for this middleware.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profile = RequestProfile() if random.random() < self.sample_rate else None
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        profile = RequestProfile() if random.random() < self.sample_rate else None
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - started)
+
+    def finish(self, request, response, profile, total):
+        """Add the Server-Timing header and log the request if it was profiled or slow."""
+        slow = self.slow_request_ms is not None and total * 1000 >= self.slow_request_ms
+        if profile is not None:
+            response['Server-Timing'] = profile.server_timing(total)
+        if profile is not None or slow:
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': _ms(total),
+                'slow': slow,
+            }
+            if profile is not None:
+                record.update(profile.as_dict())
+            logger.log(logging.WARNING if slow else logging.INFO, json.dumps(record))
+        return response
+
+    def process_template_response(self, request, response):
+        profile = _current.get()
+        if profile is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                profile.timings['render'] += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
@@ -0,0 +1,246 @@
+"""
+Materialized daily and weekly activity rollups per user and per team.
+
+Rollup documents are keyed by (user_id or team_id, granularity,
+bucket_start) and hold summed duration, distance, calories and the number
+of activities. Activity writes fold into them with upserted ``$inc``
+updates; ``rebuild_rollups`` recomputes them from scratch.
+"""
+import itertools
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+from rest_framework.exceptions import ParseError
+
+from .filters import date_range
+from .indexes import create_declared_indexes
+from . import archive, lookups, versions
+from .mongo import format_datetime, get_db
+
+GRANULARITIES = ('day', 'week')
+ROLLUP_VALUES = ('duration', 'distance', 'calories', 'activities')
+
+
+def bucket_start(date, granularity):
+    """Return the start of the day or ISO week (Monday) containing ``date``."""
+    start = datetime(date.year, date.month, date.day)
+    if granularity == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def activity_values(activity, sign=1):
+    """Return the rollup increments contributed by one activity document."""
+    return {
+        'duration': sign * activity['duration'],
+        'distance': sign * (activity.get('distance') or 0),
+        'calories': sign * activity['calories'],
+        'activities': sign,
+    }
+
+
+def apply_activity_change(old=None, new=None):
+    """Fold a single activity write into the rollups."""
+    apply_activity_changes(
+        removed=[old] if old is not None else [],
+        added=[new] if new is not None else [],
+    )
+
+
+def apply_activity_changes(removed=(), added=()):
+    """
+    Fold removed and added activity documents into the user and team
+    rollups with one bulk upsert per collection.
+    """
+    db = get_db()
+    team_ids = user_team_ids({activity['user_id'] for activity in [*removed, *added]})
+    user_deltas = defaultdict(Counter)
+    team_deltas = defaultdict(Counter)
+    for sign, activities in ((-1, removed), (1, added)):
+        for activity in activities:
+            values = activity_values(activity, sign)
+            team_id = team_ids.get(activity['user_id'])
+            for granularity in GRANULARITIES:
+                start = bucket_start(activity['date'], granularity)
+                user_deltas[(activity['user_id'], granularity, start)].update(values)
+                if team_id:
+                    team_deltas[(team_id, granularity, start)].update(values)
+    _bulk_inc(db.activity_rollups, 'user_id', user_deltas)
+    _bulk_inc(db.team_rollups, 'team_id', team_deltas)
+    versions.bump('activity_rollups', 'team_rollups')
+
+
+def user_team_ids(user_ids):
+    """Return {user_id: team_id} for the given users through the document cache."""
+    return {user_id: user.get('team_id') for user_id, user in lookups.get_users(user_ids).items()}
+
+
+def _copy_frozen(source, staging, before, batch_size):
+    """Copy the rollup buckets starting before ``before`` into ``staging``."""
+    copied = 0
+    cursor = source.find({'bucket_start': {'$lt': before}}, {'_id': 0}).batch_size(batch_size)
+    while True:
+        batch = list(itertools.islice(cursor, batch_size))
+        if not batch:
+            return copied
+        staging.insert_many(batch, ordered=False)
+        copied += len(batch)
+
+
+def _bulk_inc(collection, owner_field, deltas):
+    requests = [
+        UpdateOne(
+            {owner_field: owner, 'granularity': granularity, 'bucket_start': start},
+            {'$inc': dict(values)},
+            upsert=True,
+        )
+        for (owner, granularity, start), values in deltas.items()
+    ]
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+
+
+def daily_pipeline(since=None):
+    """Aggregation grouping activities (dated ``since`` or later) into per-user daily buckets."""
+    day = {
+        '$dateFromParts': {
+            'year': {'$year': '$date'},
+            'month': {'$month': '$date'},
+            'day': {'$dayOfMonth': '$date'},
+        }
+    }
+    match = [{'$match': {'date': {'$gte': since}}}] if since is not None else []
+    return match + [
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'bucket_start': day},
+            'duration': {'$sum': '$duration'},
+            'distance': {'$sum': {'$ifNull': ['$distance', 0]}},
+            'calories': {'$sum': '$calories'},
+            'activities': {'$sum': 1},
+        }},
+        {'$sort': {'_id.user_id': 1, '_id.bucket_start': 1}},
+    ]
+
+
+def stats_query(params):
+    """
+    Parse the stats query parameters (``user_id`` or ``team_id``,
+    ``granularity`` and ``date__gte``/``date__lte``) into the rollup
+    collection name and its Mongo filter.
+    """
+    granularity = params.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ParseError(f'Unsupported granularity "{granularity}".')
+    if params.get('user_id'):
+        owner_field, collection_name = 'user_id', 'activity_rollups'
+    elif params.get('team_id'):
+        owner_field, collection_name = 'team_id', 'team_rollups'
+    else:
+        raise ParseError('user_id or team_id is required.')
+
+    query = {owner_field: params[owner_field], 'granularity': granularity}
+    dates = date_range(params)
+    if dates:
+        query['bucket_start'] = dates
+    return collection_name, query
+
+
+def summarize_stats(query, documents):
+    """Render rollup documents sorted by bucket as the stats response body."""
+    owner_field = 'user_id' if 'user_id' in query else 'team_id'
+    buckets = []
+    totals = dict.fromkeys(ROLLUP_VALUES, 0)
+    for document in documents:
+        bucket = {'bucket_start': format_datetime(document['bucket_start'])}
+        for name in ROLLUP_VALUES:
+            bucket[name] = document.get(name, 0)
+            totals[name] += bucket[name]
+        buckets.append(bucket)
+    return {
+        owner_field: query[owner_field],
+        'granularity': query['granularity'],
+        'totals': totals,
+        'buckets': buckets,
+    }
+
+
+def rebuild(batch_size=1000):
+    """
+    Recompute every rollup from the activities collection.
+
+    Daily buckets come from one aggregation sorted by user; weekly buckets
+    are folded from them per user while streaming, and team buckets are
+    summed from the user buckets. Buckets before the archive watermark
+    are copied unchanged, since their activities have been archived.
+    Results are written to staging collections and swapped in with a
+    rename so readers never see a partial rebuild. Returns the number of
+    (user, team) rollups written.
+    """
+    db = get_db()
+    frozen_before = archive.watermark()
+    team_ids = {str(user['_id']): user.get('team_id') for user in db.users.find({}, {'team_id': 1})}
+    user_staging = db['activity_rollups_rebuild']
+    team_staging = db['team_rollups_rebuild']
+    user_staging.drop()
+    team_staging.drop()
+
+    team_deltas = defaultdict(Counter)
+    batch = []
+    written = 0
+
+    def flush():
+        nonlocal batch, written
+        if batch:
+            user_staging.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+
+    current_user = None
+    weeks = {}
+    for group in db.activities.aggregate(daily_pipeline(frozen_before), allowDiskUse=True):
+        user_id = group['_id']['user_id']
+        if user_id != current_user:
+            batch.extend(weeks.values())
+            weeks = {}
+            current_user = user_id
+        day = group['_id']['bucket_start']
+        values = {name: group[name] for name in ROLLUP_VALUES}
+        batch.append({'user_id': user_id, 'granularity': 'day', 'bucket_start': day, **values})
+
+        week = bucket_start(day, 'week')
+        if week not in weeks:
+            weeks[week] = {'user_id': user_id, 'granularity': 'week', 'bucket_start': week,
+                           **{name: 0 for name in ROLLUP_VALUES}}
+        for name in ROLLUP_VALUES:
+            weeks[week][name] += values[name]
+
+        team_id = team_ids.get(user_id)
+        if team_id:
+            team_deltas[(team_id, 'day', day)].update(values)
+            team_deltas[(team_id, 'week', week)].update(values)
+        if len(batch) >= batch_size:
+            flush()
+    batch.extend(weeks.values())
+    flush()
+
+    team_documents = [
+        {'team_id': team_id, 'granularity': granularity, 'bucket_start': start, **values}
+        for (team_id, granularity, start), values in team_deltas.items()
+    ]
+    for offset in range(0, len(team_documents), batch_size):
+        team_staging.insert_many(team_documents[offset:offset + batch_size], ordered=False)
+
+    team_written = len(team_documents)
+    if frozen_before is not None:
+        written += _copy_frozen(db.activity_rollups, user_staging, frozen_before, batch_size)
+        team_written += _copy_frozen(db.team_rollups, team_staging, frozen_before, batch_size)
+
+    for staging, target in ((user_staging, 'activity_rollups'), (team_staging, 'team_rollups')):
+        if staging.name in db.list_collection_names():
+            create_declared_indexes(staging, target)
+            staging.rename(target, dropTarget=True)
+        else:
+            db[target].delete_many({})
+    versions.bump('activity_rollups', 'team_rollups')
+    return written, team_written
@@ -1,8 +1,29 @@
+from django.db import models as django_models
 from rest_framework import serializers
 from .models import User, Team, Activity, Leaderboard, Workout
+from .mongo import format_datetime
+from .profiling import timer
 
 
-class UserSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an additional `fields` argument that
+    controls which fields should be displayed.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+    
+    def to_representation(self, instance):
+        with timer('serialize'):
+            return super().to_representation(instance)
+
+
+class UserSerializer(DynamicFieldsModelSerializer):
     id = serializers.SerializerMethodField()
     
     class Meta:
@@ -14,7 +35,7 @@ class UserSerializer(serializers.ModelSerializer):
         return str(obj._id) if obj._id else None
 
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(DynamicFieldsModelSerializer):
     id = serializers.SerializerMethodField()
     
     class Meta:
@@ -26,7 +47,7 @@ class TeamSerializer(serializers.ModelSerializer):
         return str(obj._id) if obj._id else None
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(DynamicFieldsModelSerializer):
     id = serializers.SerializerMethodField()
     
     class Meta:
@@ -38,7 +59,7 @@ class ActivitySerializer(serializers.ModelSerializer):
         return str(obj._id) if obj._id else None
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(DynamicFieldsModelSerializer):
     id = serializers.SerializerMethodField()
     
     class Meta:
@@ -50,7 +71,7 @@ class LeaderboardSerializer(serializers.ModelSerializer):
         return str(obj._id) if obj._id else None
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
+class WorkoutSerializer(DynamicFieldsModelSerializer):
     id = serializers.SerializerMethodField()
     
     class Meta:
@@ -60,3 +81,40 @@ class WorkoutSerializer(serializers.ModelSerializer):
     def get_id(self, obj):
         """Convert ObjectId to string"""
         return str(obj._id) if obj._id else None
+
+
+class FastListSerializer:
+    """
+    Read-only serializer that renders raw value rows (as returned by
+    ``QuerySet.values()``) into the same output as a ModelSerializer,
+    without building model instances or DRF field objects.
+
+    Rows are converted column by column so each field's conversion,
+    including ObjectId to string, runs as one pass over the page.
+    """
+    
+    def __init__(self, serializer_class, fields=None):
+        model = serializer_class.Meta.model
+        self.fields = list(fields or serializer_class.Meta.fields)
+        self.columns = ['_id' if name == 'id' else name for name in self.fields]
+        self.converters = [_converter(model._meta.get_field(column)) for column in self.columns]
+    
+    def to_representation(self, rows):
+        rows = list(rows)
+        with timer('serialize'):
+            columns = [
+                [None if row[column] is None else convert(row[column]) for row in rows]
+                for column, convert in zip(self.columns, self.converters)
+            ]
+            return [dict(zip(self.fields, values)) for values in zip(*columns)]
+
+
+def _converter(field):
+    """Return the function that renders a raw value like the matching DRF field."""
+    if isinstance(field, django_models.DateTimeField):
+        return format_datetime
+    if isinstance(field, django_models.FloatField):
+        return float
+    if isinstance(field, django_models.IntegerField):
+        return int
+    return str
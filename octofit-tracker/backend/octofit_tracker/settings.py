@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -83,20 +84,101 @@ WSGI_APPLICATION = 'octofit_tracker.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
-# Using djongo as the database engine to connect Django with MongoDB
+# Using djongo as the database engine to connect Django with MongoDB. The
+# octofit_tracker.db backend wraps djongo so that it shares one MongoClient
+# (and connection pool) per process with the direct pymongo code; the pool
+# is tuned with the MONGO_* environment variables below.
 
 DATABASES = {
     'default': {
-        'ENGINE': 'djongo',
+        'ENGINE': 'octofit_tracker.db',
         'NAME': 'octofit_db',
         'ENFORCE_SCHEMA': False,
         'CLIENT': {
-            'host': 'localhost',
-            'port': 27017,
+            'host': os.environ.get('MONGO_HOST', 'localhost'),
+            'port': int(os.environ.get('MONGO_PORT', '27017')),
+            'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+            'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+            'readPreference': os.environ.get('MONGO_READ_PREFERENCE', 'primary'),
         }
     }
 }
 
+# Optional pool and wire settings: how long a request waits for a pooled
+# connection before failing, and wire compression (e.g. 'zstd,zlib').
+if os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS'):
+    DATABASES['default']['CLIENT']['waitQueueTimeoutMS'] = int(os.environ['MONGO_WAIT_QUEUE_TIMEOUT_MS'])
+if os.environ.get('MONGO_COMPRESSORS'):
+    DATABASES['default']['CLIENT']['compressors'] = os.environ['MONGO_COMPRESSORS']
+
+# Extra MongoClient options for the motor client used by the async views
+# (one per event loop), e.g. a pool large enough for many concurrent requests.
+ASYNC_MONGO_CLIENT = {
+    'maxPoolSize': 200,
+}
+
+# Client classes behind the shared MongoClient and the async views' clients;
+# octofit_tracker.test_settings swaps in in-memory ones.
+MONGO_CLIENT_CLASS = 'pymongo.MongoClient'
+ASYNC_MONGO_CLIENT_CLASS = 'motor.motor_asyncio.AsyncIOMotorClient'
+
+# Leaderboard ranking: 'competition' (ties share a rank and the next rank is
+# skipped) or 'dense' (no gaps); both are maintained incrementally on writes
+LEADERBOARD_RANKING = 'competition'
+
+# Response cache for conditional GET on read-heavy endpoints. Use
+# 'octofit_tracker.cache.FileResponseCache' with a 'location' option to
+# share entries between the worker processes of one host.
+RESPONSE_CACHE = {
+    'BACKEND': 'octofit_tracker.cache.LocMemResponseCache',
+    'OPTIONS': {
+        'max_entries': 1000,
+    },
+}
+
+# Read-through cache for User and Team lookups by id. Use
+# 'octofit_tracker.lookups.SharedDocumentCache' with the 'alias' of a shared
+# CACHES entry (e.g. Redis or Memcached) to keep several workers coherent.
+DOCUMENT_CACHE = {
+    'BACKEND': 'octofit_tracker.lookups.LocMemDocumentCache',
+    'OPTIONS': {
+        'max_entries': 10000,
+        'timeout': 300,
+    },
+}
+
+# Activity ingestion: 'sync' writes each created activity immediately;
+# 'buffered' answers 202 and writes activities in batches from an in-process
+# queue. SPOOL_DIR makes queued activities survive a crash (FSYNC makes each
+# append durable against power loss too, at a latency cost).
+ACTIVITY_INGEST = {
+    'MODE': os.environ.get('OCTOFIT_ACTIVITY_INGEST', 'sync'),
+    'MAX_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'SPOOL_DIR': os.environ.get('OCTOFIT_ACTIVITY_SPOOL_DIR'),
+    'FSYNC': False,
+}
+
+# Hot/cold tiering: archive_activities moves activities dated before
+# AFTER_DAYS ago (rounded down to a Monday) to BACKEND, BATCH_SIZE at a
+# time. octofit_tracker.archive.FileArchive writes gzipped NDJSON files
+# instead; give it OPTIONS = {'directory': ...}.
+ACTIVITY_ARCHIVE = {
+    'BACKEND': 'octofit_tracker.archive.CollectionArchive',
+    'OPTIONS': {'collection': 'activities_archive'},
+    'AFTER_DAYS': int(os.environ.get('OCTOFIT_ARCHIVE_AFTER_DAYS', 30)),
+    'BATCH_SIZE': 1000,
+}
+
+# Per-request profiling: the fraction of requests that get a Server-Timing
+# header and a log line, and the duration in milliseconds above which a
+# request is always logged as slow.
+PROFILING = {
+    'SAMPLE_RATE': float(os.environ.get('OCTOFIT_PROFILING_SAMPLE_RATE', '0.01')),
+    'SLOW_REQUEST_MS': 500,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
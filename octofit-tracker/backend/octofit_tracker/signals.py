@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import lookups, versions
+from .models import Team, User
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_collection_version(sender, **kwargs):
+    """Bump the collection version of every saved or deleted octofit model."""
+    if sender._meta.app_label == 'octofit_tracker':
+        versions.bump(sender._meta.db_table)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def invalidate_cached_document(sender, instance, **kwargs):
+    """Drop a saved or deleted user or team from the document cache."""
+    lookups.invalidate(sender._meta.db_table, instance._id)
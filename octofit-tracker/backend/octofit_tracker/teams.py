@@ -0,0 +1,75 @@
+"""
+Team standings aggregated server-side.
+
+Totals come from a $group over the leaderboard and member counts from a
+$group over users. The result is cached under the versions of the
+teams, users and leaderboard collections, so any write to them, from the
+API, a rebuild or populate_db, moves on to a fresh entry.
+"""
+from django.core.cache import cache
+
+from . import versions
+from .mongo import get_db
+
+STANDINGS_CACHE_PREFIX = 'octofit:team_standings'
+STANDINGS_CACHE_TIMEOUT = 60
+STANDINGS_COLLECTIONS = ('teams', 'users', 'leaderboard')
+
+
+def team_standings():
+    """Return the cached team standings, computing them on a miss."""
+    state = versions.current(STANDINGS_COLLECTIONS)
+    key = ':'.join([STANDINGS_CACHE_PREFIX] + [str(state[name]) for name in STANDINGS_COLLECTIONS])
+    standings = cache.get(key)
+    if standings is None:
+        standings = compute_team_standings()
+        cache.set(key, standings, STANDINGS_CACHE_TIMEOUT)
+    return standings
+
+
+def compute_team_standings():
+    """
+    Rank every team by total points. Each row holds the team id and name,
+    member count, total points, total activities, average points per
+    member and a competition rank.
+    """
+    db = get_db()
+    totals = {
+        group['_id']: group
+        for group in db.leaderboard.aggregate([
+            {'$group': {
+                '_id': '$team_id',
+                'total_points': {'$sum': '$total_points'},
+                'total_activities': {'$sum': '$total_activities'},
+            }},
+        ])
+    }
+    members = {
+        group['_id']: group['members']
+        for group in db.users.aggregate([
+            {'$group': {'_id': '$team_id', 'members': {'$sum': 1}}},
+        ])
+    }
+
+    standings = []
+    for team in db.teams.find({}, {'name': 1}):
+        team_id = str(team['_id'])
+        team_totals = totals.get(team_id, {})
+        member_count = members.get(team_id, 0)
+        total_points = team_totals.get('total_points', 0)
+        standings.append({
+            'team_id': team_id,
+            'team_name': team.get('name') or '',
+            'members': member_count,
+            'total_points': total_points,
+            'total_activities': team_totals.get('total_activities', 0),
+            'average_points': round(total_points / member_count, 2) if member_count else 0,
+        })
+    standings.sort(key=lambda row: (-row['total_points'], row['team_name']))
+
+    previous_points = None
+    for position, row in enumerate(standings, start=1):
+        if row['total_points'] != previous_points:
+            rank, previous_points = position, row['total_points']
+        row['rank'] = rank
+    return standings
@@ -0,0 +1,17 @@
+"""
+Settings for running the test suite without a MongoDB server:
+
+    python manage.py test --settings=octofit_tracker.test_settings [--parallel N]
+
+Mongo is replaced by the in-memory clients of ``octofit_tracker.inmemory``
+and each parallel worker gets its own copy of the test database.
+"""
+from .settings import *  # noqa: F401,F403
+
+MONGO_CLIENT_CLASS = 'octofit_tracker.inmemory.InMemoryMongoClient'
+ASYNC_MONGO_CLIENT_CLASS = 'octofit_tracker.inmemory.AsyncInMemoryMongoClient'
+
+TEST_RUNNER = 'octofit_tracker.testing.TestRunner'
+
+# The default PBKDF2 hasher is slow by design; tests only need a hash.
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -0,0 +1,105 @@
+"""
+Test case base classes and runner for the octofit_tracker tests.
+
+djongo has no transactions, so Django's TestCase empties every collection
+with ``flush`` after each test, which re-runs the post_migrate handlers
+(content types, permissions) every time. These test cases restore
+snapshots instead: the migrated test database is snapshotted once per
+process, and what a class's ``setUpTestData`` seeds is snapshotted once
+and restored after each of its tests. A restore also rolls back the
+collection versions, so the in-process caches keyed by them are cleared.
+"""
+import multiprocessing
+import time
+
+from django.core.cache import caches
+from django.test import TestCase as DjangoTestCase
+from django.test.runner import DiscoverRunner
+from django.test.testcases import TestData
+from rest_framework.test import APITestCase as DRFAPITestCase
+
+from . import cache, lookups
+from .db.creation import restore_snapshot, take_snapshot
+from .mongo import client_class, get_db
+
+# Snapshot of each migrated test database, by name.
+_base_snapshots = {}
+
+
+def base_snapshot():
+    db = get_db()
+    if db.name not in _base_snapshots:
+        _base_snapshots[db.name] = take_snapshot(db)
+    return _base_snapshots[db.name]
+
+
+def restore(snapshot):
+    """Restore the test database to ``snapshot`` and clear the caches."""
+    restore_snapshot(get_db(), snapshot)
+    lookups.get_document_cache().clear()
+    cache.get_response_cache().clear()
+    for backend in caches.all():
+        backend.clear()
+
+
+class SnapshotTestMixin:
+    """Run ``setUpTestData`` once per class and restore its data after each test."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        base = base_snapshot()
+        attributes = cls.__dict__.copy()
+        try:
+            cls.setUpTestData()
+        except Exception:
+            restore(base)
+            super().tearDownClass()
+            raise
+        # Copied for each test, as Django's TestCase does.
+        for name, value in cls.__dict__.items():
+            if value is not attributes.get(name):
+                setattr(cls, name, TestData(name, value))
+        cls.fixture_snapshot = take_snapshot(get_db())
+
+    @classmethod
+    def tearDownClass(cls):
+        restore(base_snapshot())
+        super().tearDownClass()
+
+    def _fixture_setup(self):
+        # Skips TestCase's, which reruns setUpTestData without transactions.
+        super(DjangoTestCase, self)._fixture_setup()
+
+    def _fixture_teardown(self):
+        restore(self.fixture_snapshot)
+
+
+class TestCase(SnapshotTestMixin, DjangoTestCase):
+    pass
+
+
+class APITestCase(SnapshotTestMixin, DRFAPITestCase):
+    pass
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that reports the suite's wall-clock time. With the
+    in-memory clients, ``--parallel`` needs forked workers, which inherit
+    the test databases; otherwise the tests run serially.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        in_process = getattr(client_class(), 'in_process', False)
+        if self.parallel > 1 and in_process and multiprocessing.get_start_method() != 'fork':
+            self.log('In-memory test databases need forked workers; running the tests serially.')
+            self.parallel = 1
+
+    def run_tests(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().run_tests(*args, **kwargs)
+        finally:
+            self.log(f'Wall-clock time: {time.perf_counter() - started:.2f}s')
@@ -1,9 +1,40 @@
-from django.test import TestCase
-from rest_framework.test import APITestCase, APIClient
+from bson import ObjectId
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from pymongo import monitoring
+from pymongo.errors import AutoReconnect
 from django.urls import reverse
+from . import archive, expand, indexes, ingest, leaderboard, lookups
+from .admin import ActivityAdmin
 from .models import User, Team, Activity, Leaderboard, Workout
+from .cache import FileResponseCache, get_response_cache
+from .db.creation import restore_snapshot, take_snapshot
+from .mongo import get_client, get_db
+from .pool_metrics import PoolMetrics
+from .serializers import (
+    FastListSerializer,
+    UserSerializer,
+    TeamSerializer,
+    ActivitySerializer,
+    LeaderboardSerializer,
+    WorkoutSerializer
+)
+from .testing import APITestCase, TestCase
+from .views import WorkoutViewSet
 from datetime import datetime
+from io import StringIO
+from unittest import mock
+import gzip
+import json
+import os
+import tempfile
+import time
 
 
 class UserAPITestCase(APITestCase):
@@ -32,6 +63,16 @@ class UserAPITestCase(APITestCase):
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
+    
+    def test_get_users_sparse_fields(self):
+        """Test limiting the returned fields with ?fields=."""
+        User.objects.create(**self.user_data)
+        url = reverse('user-list')
+        response = self.client.get(url, {'fields': 'id,name'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data[0]), {'id', 'name'})
+        response = self.client.get(url, {'fields': 'id,password'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
 class TeamAPITestCase(APITestCase):
@@ -61,6 +102,69 @@ class TeamAPITestCase(APITestCase):
         self.assertEqual(len(response.data), 1)
 
 
+class TeamStandingsTestCase(APITestCase):
+    """Test cases for team rankings and aggregates."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.alpha = Team.objects.create(name='Team Alpha', description='The best team ever')
+        cls.beta = Team.objects.create(name='Team Beta', description='The second best team')
+        cls.users = [
+            User.objects.create(name='Alice', email='alice@example.com', team_id=str(cls.alpha._id)),
+            User.objects.create(name='Bob', email='bob@example.com', team_id=str(cls.alpha._id)),
+            User.objects.create(name='Carol', email='carol@example.com', team_id=str(cls.beta._id)),
+        ]
+    
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+    
+    def post_activity(self, user, calories):
+        self.client.post(reverse('activity-list'), {
+            'user_id': str(user._id),
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': calories,
+            'date': '2024-01-01T08:00:00Z'
+        }, format='json')
+    
+    def test_ranking_is_invalidated_by_activity_writes(self):
+        """Test team totals and that new activities refresh the cached ranking."""
+        self.post_activity(self.users[0], 300)
+        self.post_activity(self.users[2], 400)
+        response = self.client.get(reverse('team-ranking'), format='json')
+        self.assertEqual([row['team_name'] for row in response.data], ['Team Beta', 'Team Alpha'])
+        self.post_activity(self.users[1], 200)
+        response = self.client.get(reverse('team-ranking'), format='json')
+        alpha = response.data[0]
+        self.assertEqual(alpha['team_name'], 'Team Alpha')
+        self.assertEqual((alpha['members'], alpha['total_points'], alpha['total_activities']), (2, 500, 2))
+        self.assertEqual((alpha['average_points'], alpha['rank']), (250, 1))
+    
+    def test_ranking_follows_user_and_team_writes(self):
+        """Test that new members and new teams show in the cached ranking and team detail."""
+        response = self.client.get(reverse('team-ranking'), format='json')
+        self.assertEqual({row['team_name']: row['members'] for row in response.data},
+                         {'Team Alpha': 2, 'Team Beta': 1})
+        self.client.post(reverse('user-list'), {
+            'name': 'Dave', 'email': 'dave@example.com', 'team_id': str(self.beta._id),
+        }, format='json')
+        gamma = Team.objects.create(name='Team Gamma', description='The newest team')
+        response = self.client.get(reverse('team-ranking'), format='json')
+        self.assertEqual({row['team_name']: row['members'] for row in response.data},
+                         {'Team Alpha': 2, 'Team Beta': 2, 'Team Gamma': 0})
+        response = self.client.get(reverse('team-detail', args=[str(gamma._id)]), format='json')
+        self.assertEqual(response.data['stats']['members'], 0)
+    
+    def test_team_detail_includes_stats(self):
+        """Test that the team detail view embeds its aggregates."""
+        self.post_activity(self.users[2], 400)
+        response = self.client.get(reverse('team-detail', args=[str(self.beta._id)]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Team Beta')
+        self.assertEqual(response.data['stats']['total_points'], 400)
+
+
 class ActivityAPITestCase(APITestCase):
     """Test cases for Activity API endpoints."""
     
@@ -88,7 +192,30 @@ class ActivityAPITestCase(APITestCase):
         url = reverse('activity-list')
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+    
+    def test_paginate_activities(self):
+        """Test walking the activity list with keyset cursors."""
+        for day in range(1, 6):
+            Activity.objects.create(**dict(self.activity_data, date=datetime(2024, 1, day // 2 + 1)))
+        url = reverse('activity-list')
+        response = self.client.get(url, {'page_size': 2}, format='json')
+        seen = [(item['date'], item['id']) for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'], format='json')
+            seen += [(item['date'], item['id']) for item in response.data['results']]
+        self.assertEqual(len(set(seen)), 5)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+    
+    def test_paginate_activities_sparse_fields(self):
+        """Test that sparse fieldsets keep pagination working."""
+        for day in range(1, 4):
+            Activity.objects.create(**dict(self.activity_data, date=datetime(2024, 1, day)))
+        url = reverse('activity-list')
+        response = self.client.get(url, {'page_size': 2, 'fields': 'id,duration'}, format='json')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'duration'})
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual(len(response.data['results']), 1)
 
 
 class LeaderboardAPITestCase(APITestCase):
@@ -119,7 +246,57 @@ class LeaderboardAPITestCase(APITestCase):
         url = reverse('leaderboard-list')
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class LeaderboardRankingTestCase(APITestCase):
+    """Test cases for the ranking engine and ranked leaderboard queries."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        for index, points in enumerate([500, 300, 300, 200, 100, 100, 50]):
+            Leaderboard.objects.create(
+                user_id=f'user{index}',
+                user_name=f'User {index}',
+                team_id='team123',
+                team_name='Team Alpha',
+                total_points=points,
+                total_activities=1
+            )
+    
+    def ranks(self):
+        return [entry.rank for entry in Leaderboard.objects.order_by('-total_points', 'user_id')]
+    
+    def test_competition_and_dense_ranks(self):
+        """Test that ties share a rank under both methods."""
+        leaderboard.recompute_ranks('competition')
+        self.assertEqual(self.ranks(), [1, 2, 2, 4, 5, 5, 7])
+        leaderboard.recompute_ranks('dense')
+        self.assertEqual(self.ranks(), [1, 2, 2, 3, 4, 4, 5])
+    
+    def test_incremental_dense_ranks_match_recompute(self):
+        """Test that dense ranks follow score values appearing and disappearing."""
+        leaderboard.recompute_ranks('dense')
+        with override_settings(LEADERBOARD_RANKING='dense'):
+            for user_id, points in [('user3', 100), ('user0', -200), ('user4', 250), ('user7', 300),
+                                    ('user6', 900), ('user1', -300), ('user2', -300)]:
+                leaderboard.apply_deltas({user_id: (points, 1)})
+                incremental = self.ranks()
+                leaderboard.recompute_ranks('dense')
+                self.assertEqual(incremental, self.ranks())
+    
+    def test_top_and_around(self):
+        """Test top-K and neighbourhood queries."""
+        leaderboard.recompute_ranks('competition')
+        response = self.client.get(reverse('leaderboard-top'), {'k': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['rank'] for item in response.data], [1, 2, 2])
+        response = self.client.get(reverse('leaderboard-around', args=['user3']), {'n': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rank'], 4)
+        self.assertEqual([item['total_points'] for item in response.data['results']], [300, 300, 200, 100, 100])
+        response = self.client.get(reverse('leaderboard-around', args=['nobody']), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
 class WorkoutAPITestCase(APITestCase):
@@ -152,6 +329,735 @@ class WorkoutAPITestCase(APITestCase):
         self.assertEqual(len(response.data), 1)
 
 
+class ConditionalGetTestCase(APITestCase):
+    """Test cases for ETags and the response cache."""
+    
+    def setUp(self):
+        get_response_cache().clear()
+        self.client = APIClient()
+        self.workout_data = {
+            'name': 'Morning Run',
+            'category': 'Cardio',
+            'difficulty': 'Medium',
+            'duration': 30,
+            'calories_burn': 300,
+            'description': 'A nice morning run to start the day'
+        }
+    
+    def test_not_modified_until_written(self):
+        """Test 304 responses and that writes change the ETag."""
+        url = reverse('workout-list')
+        self.client.post(url, self.workout_data, format='json')
+        response = self.client.get(url, format='json')
+        etag = response['ETag']
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.post(url, dict(self.workout_data, name='Evening Run'), format='json')
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(json.loads(response.content)), 2)
+    
+    def test_checked_after_permissions_and_per_user(self):
+        """Test that 304s and cached bodies honour permissions and are not shared between users."""
+        url = reverse('workout-list')
+        self.client.post(url, self.workout_data, format='json')
+        etag = self.client.get(url, format='json')['ETag']
+        with mock.patch.object(WorkoutViewSet, 'permission_classes', [IsAuthenticated]):
+            response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+            self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+            response = self.client.get(url, format='json')
+            self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+            self.client.force_authenticate(get_user_model().objects.create_user('tony', password='stark'))
+            response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+            response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_file_cache_evicts_least_recently_used(self):
+        """Test the file-based cache's size bound and LRU eviction."""
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = FileResponseCache(location, max_entries=2)
+            file_cache.set('a', (b'a', 'application/json'))
+            file_cache.set('b', (b'b', 'application/json'))
+            os.utime(file_cache._path('a'), (0, 0))
+            os.utime(file_cache._path('b'), (1, 1))
+            file_cache.get('a')
+            file_cache.set('c', (b'c', 'application/json'))
+            self.assertIsNone(file_cache.get('b'))
+            self.assertEqual(file_cache.get('a'), (b'a', 'application/json'))
+            self.assertEqual(file_cache.get('c'), (b'c', 'application/json'))
+
+
+class ProfilingMiddlewareTestCase(APITestCase):
+    """Test cases for the profiling middleware."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        User.objects.create(name='Tony Stark', email='tony@stark.com')
+    
+    @override_settings(PROFILING={'SAMPLE_RATE': 1.0, 'SLOW_REQUEST_MS': None})
+    def test_sampled_request_has_server_timing(self):
+        """Test that a sampled request gets a Server-Timing header and a log line."""
+        with self.assertLogs('octofit_tracker.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('user-list'), format='json')
+        timing = response['Server-Timing']
+        for metric in ('mongo;', 'mongo-max;', 'serialize;', 'render;', 'total;'):
+            self.assertIn(metric, timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('user-list'))
+        self.assertIn('mongo_commands', record)
+    
+    @override_settings(PROFILING={'SAMPLE_RATE': 0.0, 'SLOW_REQUEST_MS': 0})
+    def test_slow_request_logged_when_not_sampled(self):
+        """Test that slow requests are logged without a Server-Timing header."""
+        with self.assertLogs('octofit_tracker.profiling', 'WARNING') as logs:
+            response = self.client.get(reverse('user-list'), format='json')
+        self.assertNotIn('Server-Timing', response)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['slow'])
+        self.assertNotIn('mongo_commands', record)
+
+
+class BenchmarkApiTestCase(TestCase):
+    """Test cases for the benchmark_api management command."""
+    
+    def test_benchmark_writes_results(self):
+        """Test that every route is exercised, results are saved as JSON and the database is untouched."""
+        user = User.objects.create(name='Thor', email='thor@asgard.com')
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_api', scales='40', concurrency='1,2', requests=3,
+                output=output, stdout=StringIO(),
+            )
+            with open(output) as handle:
+                results = json.load(handle)['results']
+        endpoints = {row['endpoint'] for row in results}
+        for route in ('users', 'teams', 'activities', 'leaderboard', 'workouts'):
+            for operation in ('list', 'detail', 'create'):
+                self.assertIn(f'{route} {operation}', endpoints)
+        self.assertIn('activities bulk', endpoints)
+        self.assertEqual({row['concurrency'] for row in results}, {1, 2})
+        for row in results:
+            self.assertEqual(row['errors'], 0, row['endpoint'])
+            self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+        self.assertEqual(list(User.objects.all()), [user])
+        self.assertEqual(Activity.objects.count(), 0)
+    
+    def test_remote_benchmark_keeps_local_data(self):
+        """Test that --url benchmarks the server's data without reseeding the local database."""
+        user = User.objects.create(name='Thor', email='thor@asgard.com')
+        transport = 'octofit_tracker.management.commands.benchmark_api.HttpTransport'
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch(f'{transport}.request', return_value=200) as request, \
+                mock.patch(f'{transport}.ids', return_value=['0' * 24]):
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_api', url='http://octofit.example', concurrency='1', requests=2,
+                output=output, stdout=StringIO(), stderr=StringIO(),
+            )
+            with open(output) as handle:
+                results = json.load(handle)['results']
+        self.assertEqual(list(User.objects.all()), [user])
+        self.assertEqual({row['scale'] for row in results}, {None})
+        request.assert_any_call('GET', f'/api/users/{"0" * 24}/', None)
+
+
+class AsyncReadAPITestCase(APITestCase):
+    """Test cases for the async read endpoints."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.team = Team.objects.create(name='Team Alpha', description='The best team ever')
+        self.alice = User.objects.create(name='Alice', email='alice@example.com', team_id=str(self.team._id))
+        url = reverse('activity-list')
+        for day in range(1, 6):
+            self.client.post(url, {
+                'user_id': str(self.alice._id),
+                'activity_type': 'Running',
+                'duration': 30,
+                'distance': 5.0,
+                'calories': 100 * day,
+                'date': f'2024-01-0{day}T08:00:00Z'
+            }, format='json')
+    
+    def assertSameResponse(self, sync_name, async_name, params):
+        expected = self.client.get(reverse(sync_name), params, format='json')
+        response = self.client.get(reverse(async_name), params)
+        self.assertEqual(response.status_code, expected.status_code)
+        data, expected_data = json.loads(response.content), json.loads(expected.content)
+        if data.get('next'):
+            data['next'] = data['next'].replace('/api/async/', '/api/')
+        self.assertEqual(data, expected_data)
+        return data
+    
+    def test_async_activity_list_matches_sync(self):
+        """Test that async activity pages, filters and cursors match the DRF endpoint."""
+        page = self.assertSameResponse(
+            'activity-list', 'async-activity-list', {'team_id': str(self.team._id), 'page_size': 2}
+        )
+        self.assertEqual(len(page['results']), 2)
+        cursor = page['next'].split('cursor=')[1].split('&')[0]
+        self.assertSameResponse(
+            'activity-list', 'async-activity-list',
+            {'team_id': str(self.team._id), 'page_size': 2, 'cursor': cursor},
+        )
+        self.assertSameResponse('activity-list', 'async-activity-list', {'date__gte': 'not a date'})
+    
+    def test_async_activity_list_reads_archive(self):
+        """Test that a date filter reaching the archive spans both tiers, as in the DRF endpoint."""
+        archive.archive_activities(after_days=0)
+        try:
+            self.client.post(reverse('activity-list'), {
+                'user_id': str(self.alice._id), 'activity_type': 'Running', 'duration': 30,
+                'calories': 600, 'date': datetime.utcnow().isoformat() + 'Z',
+            }, format='json')
+            page = self.assertSameResponse('activity-list', 'async-activity-list',
+                                           {'date__gte': '2024-01-01', 'page_size': 4})
+            self.assertEqual([row['calories'] for row in page['results']], [600, 500, 400, 300])
+            cursor = page['next'].split('cursor=')[1].split('&')[0]
+            self.assertSameResponse('activity-list', 'async-activity-list',
+                                    {'date__gte': '2024-01-01', 'page_size': 4, 'cursor': cursor})
+        finally:
+            archive.clear()
+    
+    def test_async_leaderboard_and_stats_match_sync(self):
+        """Test that the async leaderboard and stats endpoints match the DRF ones."""
+        self.assertSameResponse('leaderboard-list', 'async-leaderboard-list', {})
+        self.assertSameResponse('stats', 'async-stats', {'user_id': str(self.alice._id), 'granularity': 'week'})
+        self.assertSameResponse('stats', 'async-stats', {})
+
+
+class ConnectionPoolTestCase(APITestCase):
+    """Test cases for the shared MongoClient and pool metrics."""
+    
+    def test_djongo_uses_shared_client(self):
+        """Test that djongo connections share the process-wide client."""
+        self.assertIs(get_db().client, get_client())
+        connection.close()
+        self.assertIs(get_db().client, get_client())
+    
+    def test_pool_metrics(self):
+        """Test checkout, wait and failure accounting."""
+        metrics = PoolMetrics()
+        address = ('localhost', 27017)
+        metrics.pool_created(monitoring.PoolCreatedEvent(address, {'maxPoolSize': 2}))
+        metrics.connection_created(monitoring.ConnectionCreatedEvent(address, 1))
+        metrics.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+        metrics.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1))
+        metrics.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+        metrics.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(address, 'timeout'))
+        pool = metrics.snapshot()['pools'][0]
+        self.assertEqual(pool['address'], 'localhost:27017')
+        self.assertEqual(pool['max_pool_size'], 2)
+        self.assertEqual((pool['open_connections'], pool['in_use'], pool['checkouts']), (1, 1, 1))
+        self.assertEqual(pool['checkout_failures'], {'timeout': 1})
+        metrics.connection_checked_in(monitoring.ConnectionCheckedInEvent(address, 1))
+        self.assertEqual(metrics.snapshot()['pools'][0]['in_use'], 0)
+        
+        response = self.client.get(reverse('pool-metrics'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('pools', response.data)
+
+
+class ExpandAPITestCase(APITestCase):
+    """Test cases for ?expand= on activities and users."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.team = Team.objects.create(name='Team DC', description='Justice League')
+        self.batman = User.objects.create(name='Batman', email='bruce@dc.com', team_id=str(self.team._id))
+        self.loner = User.objects.create(name='Loner', email='loner@example.com')
+        for user in (self.batman, self.batman, self.loner):
+            Activity.objects.create(
+                user_id=str(user._id), activity_type='Running', duration=45,
+                distance=5.0, calories=400, date=datetime(2024, 1, 1, 8, 0)
+            )
+    
+    def test_expand_activities_with_fixed_queries(self):
+        """Test that users and teams are embedded with one lookup per collection."""
+        with mock.patch('octofit_tracker.expand.fetch_documents', wraps=expand.fetch_documents) as fetch:
+            response = self.client.get(reverse('activity-list'), {'expand': 'user,team'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(fetch.call_count, 2)
+        rows = {row['user']['name']: row for row in response.data['results']}
+        self.assertEqual(rows['Batman']['team'], {'id': str(self.team._id), 'name': 'Team DC'})
+        self.assertIsNone(rows['Loner']['team'])
+        
+        response = self.client.get(
+            reverse('activity-list'), {'expand': 'user', 'fields': 'id,duration'}, format='json'
+        )
+        self.assertIn(response.data['results'][0]['user']['name'], ('Batman', 'Loner'))
+        self.assertIn('user_id', response.data['results'][0])
+        response = self.client.get(reverse('activity-list'), {'expand': 'coach'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_expand_user_detail(self):
+        """Test that a user's team is embedded in the detail response."""
+        url = reverse('user-detail', args=[str(self.batman._id)])
+        response = self.client.get(url, {'expand': 'team'}, format='json')
+        self.assertEqual(response.data['team']['name'], 'Team DC')
+
+
+class BatchRetrieveAPITestCase(APITestCase):
+    """Test cases for retrieving several documents by id."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.workouts = [
+            Workout.objects.create(
+                name=f'Workout {number}', category='Cardio', difficulty='Easy',
+                duration=30, calories_burn=200, description='Warm up'
+            )
+            for number in range(3)
+        ]
+    
+    def test_get_by_ids_in_requested_order(self):
+        """Test that ?ids= returns the documents in the requested order."""
+        ids = [str(self.workouts[2]._id), str(self.workouts[0]._id)]
+        response = self.client.get(reverse('workout-list'), {'ids': ','.join(ids)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data], ids)
+        
+        response = self.client.get(reverse('workout-list'), {'ids': 'not-an-id'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_post_batch_skips_missing_ids(self):
+        """Test the POST variant and that unknown ids are left out."""
+        ids = [str(self.workouts[1]._id), '0' * 24, str(self.workouts[0]._id)]
+        response = self.client.post(reverse('workout-batch'), {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data], [ids[0], ids[2]])
+        self.assertEqual(response.data[0]['name'], 'Workout 1')
+    
+    def test_post_batch_honours_fields_and_expand(self):
+        """Test that ?fields= and ?expand= apply to the POST variant too."""
+        team = Team.objects.create(name='Team Marvel', description='Avengers')
+        user = User.objects.create(name='Thor', email='thor@asgard.com', team_id=str(team._id))
+        activity = Activity.objects.create(user_id=str(user._id), activity_type='Running', duration=30,
+                                           calories=300, date=datetime(2024, 1, 1))
+        url = reverse('activity-batch') + '?fields=id,calories&expand=user,team'
+        response = self.client.post(url, {'ids': [str(activity._id)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row, = response.data
+        self.assertEqual(set(row), {'id', 'calories', 'user_id', 'user', 'team'})
+        self.assertEqual((row['user']['name'], row['team']['name']), ('Thor', 'Team Marvel'))
+
+
+class DocumentCacheTestCase(APITestCase):
+    """Test cases for the User and Team read-through cache."""
+    
+    def setUp(self):
+        lookups.get_document_cache().clear()
+        self.team = Team.objects.create(name='Team Marvel', description='Avengers')
+        self.user = User.objects.create(name='Thor', email='thor@asgard.com', team_id=str(self.team._id))
+    
+    def test_read_through_and_invalidation(self):
+        """Test that lookups are cached and that saves invalidate them."""
+        user_id = str(self.user._id)
+        cache = lookups.get_document_cache()
+        before = cache.stats()
+        self.assertEqual(lookups.get_users([user_id])[user_id]['name'], 'Thor')
+        with mock.patch('octofit_tracker.lookups.get_db') as get_db_mock:
+            self.assertEqual(lookups.get_users([user_id])[user_id]['name'], 'Thor')
+            get_db_mock.assert_not_called()
+        self.assertEqual(cache.stats()['hits'] - before['hits'], 1)
+        
+        self.user.name = 'Thor Odinson'
+        self.user.save()
+        self.assertEqual(lookups.get_users([user_id])[user_id]['name'], 'Thor Odinson')
+        self.team.delete()
+        self.assertEqual(lookups.get_teams([str(self.team._id)]), {})
+        
+        response = self.client.get(reverse('cache-metrics'), format='json')
+        self.assertIn('hit_rate', response.data)
+    
+    def test_entries_expire_and_are_bounded(self):
+        """Test the timeout and the LRU size bound of the in-process backend."""
+        cache = lookups.LocMemDocumentCache(max_entries=2, timeout=60)
+        cache.set_many('users', {'a': {'id': 'a'}, 'b': {'id': 'b'}})
+        cache.get_many('users', {'a'})
+        cache.set_many('users', {'c': {'id': 'c'}})
+        self.assertEqual(set(cache.get_many('users', {'a', 'b', 'c'})), {'a', 'c'})
+        with mock.patch('octofit_tracker.lookups.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(cache.get_many('users', {'a'}), {})
+
+
+class BufferedIngestTestCase(APITestCase):
+    """Test cases for write-behind activity ingestion."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(name='Natasha', email='natasha@shield.com')
+        self.activity_data = {
+            'user_id': str(self.user._id),
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': 250,
+            'date': '2024-01-01T08:00:00Z'
+        }
+    
+    def post_buffered(self, buffer, headers=None, **changes):
+        with override_settings(ACTIVITY_INGEST={'MODE': 'buffered'}), \
+                mock.patch('octofit_tracker.ingest._buffer', buffer):
+            return self.client.post(
+                reverse('activity-list'), dict(self.activity_data, **changes), format='json', **(headers or {})
+            )
+    
+    def test_buffered_create_is_written_on_drain(self):
+        """Test the 202 response, the spooled write and the leaderboard update."""
+        with tempfile.TemporaryDirectory() as spool_dir:
+            buffer = ingest.ActivityBuffer(batch_size=10, flush_interval=60, spool_dir=spool_dir)
+            response = self.post_buffered(buffer)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(len(os.listdir(spool_dir)), 1)
+            buffer.close()
+            self.assertEqual(os.listdir(spool_dir), [])
+        activity = get_db().activities.find_one({'_id': ObjectId(response.data['id'])})
+        self.assertEqual(activity['calories'], 250)
+        entry = Leaderboard.objects.get(user_id=str(self.user._id))
+        self.assertEqual((entry.total_points, entry.total_activities), (250, 1))
+    
+    def test_full_buffer_returns_503(self):
+        """Test backpressure when the buffer is at capacity."""
+        buffer = ingest.ActivityBuffer(max_size=1, batch_size=10, flush_interval=60)
+        self.assertEqual(self.post_buffered(buffer).status_code, status.HTTP_202_ACCEPTED)
+        response = self.post_buffered(buffer, duration=45)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', response)
+        buffer.close()
+        self.assertEqual(get_db().activities.count_documents({}), 1)
+    
+    def test_identical_queued_uploads_share_an_id(self):
+        """Test that a retry arriving before the flush gets the queued activity's id."""
+        buffer = ingest.ActivityBuffer(batch_size=10, flush_interval=60)
+        first = self.post_buffered(buffer)
+        retry = self.post_buffered(buffer)
+        self.assertEqual((first.status_code, retry.status_code), (status.HTTP_202_ACCEPTED, status.HTTP_202_ACCEPTED))
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(buffer.pending(), 1)
+        buffer.close()
+        self.assertEqual(get_db().activities.count_documents({'_id': ObjectId(first.data['id'])}), 1)
+        self.assertEqual(buffer._keys, {})
+        
+        buffer = ingest.ActivityBuffer(batch_size=10, flush_interval=60)
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'upload-1'}
+        first = self.post_buffered(buffer, headers, date='2024-01-02T08:00:00Z')
+        retry = self.post_buffered(buffer, headers, date='2024-01-02T08:00:00Z', calories=999)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual((retry.data['calories'], retry.data['date']), (250, '2024-01-02T08:00:00Z'))
+        buffer.close()
+    
+    def test_retries_count_towards_capacity(self):
+        """Test that batches awaiting a retry keep the buffer full while writes keep failing."""
+        buffer = ingest.ActivityBuffer(max_size=3, batch_size=1, flush_interval=0.01)
+        with mock.patch.object(get_db().activities.__class__, 'insert_many',
+                               side_effect=AutoReconnect('connection refused')) as insert_many, \
+                self.assertLogs('octofit_tracker.ingest', 'ERROR'):
+            statuses = []
+            for duration in range(30, 40):
+                statuses.append(self.post_buffered(buffer, duration=duration).status_code)
+                time.sleep(0.02)
+            self.assertTrue(insert_many.called)
+        self.assertEqual(statuses.count(status.HTTP_202_ACCEPTED), 3)
+        self.assertEqual(buffer.pending(), 3)
+        buffer.close()
+        self.assertEqual(get_db().activities.count_documents({}), 3)
+    
+    def test_failed_write_is_retried(self):
+        """Test that a batch whose insert fails stays buffered and is written on a retry."""
+        collection_class = get_db().activities.__class__
+        insert_many = collection_class.insert_many
+        calls = []
+        
+        def flaky_insert_many(collection, *args, **kwargs):
+            calls.append(collection.name)
+            if len(calls) == 1:
+                raise AutoReconnect('connection refused')
+            return insert_many(collection, *args, **kwargs)
+        
+        buffer = ingest.ActivityBuffer(batch_size=1, flush_interval=0.01)
+        with mock.patch.object(collection_class, 'insert_many', flaky_insert_many), \
+                self.assertLogs('octofit_tracker.ingest', 'ERROR'):
+            response = self.post_buffered(buffer)
+            buffer.close()
+        self.assertEqual(calls, ['activities', 'activities'])
+        self.assertEqual(get_db().activities.count_documents({'_id': ObjectId(response.data['id'])}), 1)
+        self.assertEqual(Leaderboard.objects.get(user_id=str(self.user._id)).total_points, 250)
+    
+    def test_spool_of_dead_process_is_replayed_once(self):
+        """Test that a crashed process's spool is written and replays are idempotent."""
+        document = {
+            '_id': ObjectId(), 'user_id': str(self.user._id), 'activity_type': 'Cycling',
+            'duration': 60, 'distance': 20.0, 'calories': 500, 'date': datetime(2024, 1, 2),
+        }
+        line = json.dumps(ingest._encode(document)) + '\n'
+        with tempfile.TemporaryDirectory() as spool_dir:
+            for name in ('activities-1.spool', 'activities-1-0.flushing'):
+                with open(os.path.join(spool_dir, name), 'w') as handle:
+                    handle.write(line)
+            with mock.patch('octofit_tracker.ingest._process_alive', return_value=False):
+                ingest.ActivityBuffer(spool_dir=spool_dir)._replay_spool()
+            self.assertEqual(os.listdir(spool_dir), [])
+        self.assertEqual(get_db().activities.count_documents({'_id': document['_id']}), 1)
+        self.assertEqual(Leaderboard.objects.get(user_id=str(self.user._id)).total_points, 500)
+
+
+class DeduplicationTestCase(APITestCase):
+    """Test cases for idempotent activity uploads and deduplication."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        indexes.create_declared_indexes(get_db().activities, 'activities')
+        self.user = User.objects.create(name='Wanda', email='wanda@westview.com')
+        self.activity_data = {
+            'user_id': str(self.user._id),
+            'activity_type': 'Running',
+            'duration': 30,
+            'distance': 5.0,
+            'calories': 300,
+            'date': '2024-01-01T08:00:00Z'
+        }
+    
+    def test_retried_create_returns_existing_activity(self):
+        """Test that retries match by content or Idempotency-Key and count once."""
+        url = reverse('activity-list')
+        first = self.client.post(url, self.activity_data, format='json')
+        retry = self.client.post(url, dict(self.activity_data, date='2024-01-01T09:00:00+01:00'), format='json')
+        self.assertEqual((first.status_code, retry.status_code), (status.HTTP_201_CREATED, status.HTTP_200_OK))
+        self.assertEqual(retry.data['id'], first.data['id'])
+        
+        keyed = self.client.post(url, dict(self.activity_data, duration=31), format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.client.post(url, dict(self.activity_data, duration=32), format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual((keyed.status_code, retry.status_code), (status.HTTP_201_CREATED, status.HTTP_200_OK))
+        self.assertEqual((retry.data['id'], retry.data['duration']), (keyed.data['id'], 31))
+        self.assertEqual(Activity.objects.count(), 2)
+        entry = Leaderboard.objects.get(user_id=str(self.user._id))
+        self.assertEqual((entry.total_points, entry.total_activities), (600, 2))
+    
+    def test_bulk_reports_existing_activities(self):
+        """Test that bulk items already stored or repeated are not inserted again."""
+        created = self.client.post(reverse('activity-list'), self.activity_data, format='json')
+        other = dict(self.activity_data, activity_type='Cycling')
+        response = self.client.post(reverse('activity-bulk'), [other, self.activity_data, other], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row['index'] for row in response.data['created']], [0])
+        self.assertEqual(response.data['existing'], [
+            {'index': 1, 'id': created.data['id']},
+            {'index': 2, 'id': response.data['created'][0]['id']},
+        ])
+        self.assertEqual(Activity.objects.count(), 2)
+    
+    def test_edit_rekeys_activity(self):
+        """Test that an edited activity is matched by its new content, not its old one."""
+        url = reverse('activity-list')
+        first = self.client.post(url, self.activity_data, format='json')
+        detail = reverse('activity-detail', args=[first.data['id']])
+        response = self.client.patch(detail, {'duration': 45}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        edited = self.client.post(url, dict(self.activity_data, duration=45), format='json')
+        self.assertEqual((edited.status_code, edited.data['id']), (status.HTTP_200_OK, first.data['id']))
+        original = self.client.post(url, self.activity_data, format='json')
+        self.assertEqual(original.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Activity.objects.count(), 2)
+        
+        response = self.client.patch(detail, {'duration': 30}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Activity.objects.get(_id=ObjectId(first.data['id'])).duration, 45)
+    
+    def test_dedupe_activities_command(self):
+        """Test that existing duplicates are removed and the kept rows keyed."""
+        data = dict(self.activity_data, date=datetime(2024, 1, 1, 8))
+        kept = Activity.objects.create(**data)
+        Activity.objects.create(**data)
+        Activity.objects.create(**dict(data, duration=45))
+        call_command('rebuild_rollups', stdout=StringIO())
+        leaderboard.rebuild()
+        
+        out = StringIO()
+        call_command('dedupe_activities', '--batch-size', '1', stdout=out)
+        self.assertIn('Duplicates removed: 1', out.getvalue())
+        self.assertEqual(Activity.objects.count(), 2)
+        self.assertEqual(get_db().activities.count_documents({'dedupe_key': {'$type': 'string'}}), 2)
+        self.assertTrue(get_db().activities.find_one({'_id': kept._id}))
+        self.assertEqual(Leaderboard.objects.get(user_id=str(self.user._id)).total_points, 600)
+        
+        response = self.client.post(reverse('activity-list'), self.activity_data, format='json')
+        self.assertEqual((response.status_code, response.data['id']), (status.HTTP_200_OK, str(kept._id)))
+
+
+class LargeCollectionAdminTestCase(TestCase):
+    """Test cases for the cursor-paged Activity and Leaderboard admin."""
+    
+    def setUp(self):
+        cache.clear()
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@octofit.example', 'secret')
+        self.client.force_login(admin_user)
+        for day, (user_id, activity_type) in enumerate(
+            [('user-a1', 'Running'), ('user-b1', 'Cycling'), ('user-a2', 'Running'), ('user-b2', 'Yoga'),
+             ('user-a3', 'Swimming')], start=1
+        ):
+            Activity.objects.create(
+                user_id=user_id, activity_type=activity_type, duration=30, calories=200, date=datetime(2024, 1, day)
+            )
+        self.url = reverse('admin:octofit_tracker_activity_changelist')
+    
+    def test_changelist_walks_cursor_pages(self):
+        """Test cursor pagination and the estimated count of the unfiltered list."""
+        with mock.patch.object(ActivityAdmin, 'list_per_page', 2):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.context['cl'].result_count, 5)
+            seen = []
+            while True:
+                cl = response.context['cl']
+                seen += [activity.user_id for activity in cl.result_list]
+                if cl.next_url is None:
+                    break
+                response = self.client.get(self.url + cl.next_url)
+        self.assertEqual(seen, ['user-a3', 'user-b2', 'user-a2', 'user-b1', 'user-a1'])
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, status.HTTP_302_FOUND)
+    
+    def test_prefix_search_and_cached_filter_choices(self):
+        """Test prefix search, counted filtered lists and cached distinct choices."""
+        response = self.client.get(self.url, {'q': 'user-a'})
+        cl = response.context['cl']
+        self.assertEqual(sorted(activity.user_id for activity in cl.result_list), ['user-a1', 'user-a2', 'user-a3'])
+        self.assertEqual((cl.result_count, cl.full_result_count), (3, 5))
+        
+        choices = [value for value, _ in cl.filter_specs[0].lookup_choices]
+        self.assertEqual(choices, ['Cycling', 'Running', 'Swimming', 'Yoga'])
+        Activity.objects.create(user_id='user-c1', activity_type='Boxing', duration=30, calories=200,
+                                date=datetime(2024, 2, 1))
+        response = self.client.get(self.url, {'activity_type': 'Running'})
+        cl = response.context['cl']
+        self.assertNotIn('Boxing', [value for value, _ in cl.filter_specs[0].lookup_choices])
+        self.assertEqual([activity.user_id for activity in cl.result_list], ['user-a2', 'user-a1'])
+        
+        response = self.client.get(reverse('admin:octofit_tracker_leaderboard_changelist'), {'q': 'Thor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_search_term_is_matched_literally(self):
+        """Test that regex metacharacters and % in a search term match only themselves."""
+        for user_id in ['user.(x)+[1]', 'userA(x)+[1]', 'user-50%', 'user-500']:
+            Activity.objects.create(user_id=user_id, activity_type='Running', duration=30, calories=200,
+                                    date=datetime(2024, 2, 1))
+        for term, expected in [('user.(x', ['user.(x)+[1]']), ('user.(x)+[', ['user.(x)+[1]']),
+                               ('user-50%', ['user-50%']), ('user.', ['user.(x)+[1]'])]:
+            response = self.client.get(self.url, {'q': term})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([activity.user_id for activity in response.context['cl'].result_list], expected)
+
+
+class ArchiveTestCase(APITestCase):
+    """Test cases for moving old activities to the archive tier."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(name='Clint', email='clint@shield.com')
+        recent = datetime.utcnow().replace(microsecond=0)
+        for date, calories in (('2023-01-02T08:00:00Z', 100), ('2023-01-03T08:00:00Z', 200),
+                               (recent.isoformat() + 'Z', 400)):
+            self.client.post(reverse('activity-list'), {
+                'user_id': str(self.user._id), 'activity_type': 'Archery', 'duration': 30,
+                'calories': calories, 'date': date,
+            }, format='json')
+    
+    def tearDown(self):
+        archive.clear()
+    
+    def list_dates(self, params):
+        dates = []
+        response = self.client.get(reverse('activity-list'), params, format='json')
+        while True:
+            dates += [row['date'][:10] for row in response.data['results']]
+            if not response.data['next']:
+                return dates
+            response = self.client.get(response.data['next'], format='json')
+    
+    def test_archive_keeps_totals_and_spans_reads(self):
+        """Test that totals survive archiving and rebuilds and date filters read both tiers."""
+        out = StringIO()
+        call_command('archive_activities', stdout=out)
+        self.assertIn('Activities archived: 2', out.getvalue())
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(get_db().activities_archive.count_documents({}), 2)
+        
+        leaderboard.rebuild()
+        call_command('rebuild_rollups', stdout=StringIO())
+        entry = Leaderboard.objects.get(user_id=str(self.user._id))
+        self.assertEqual((entry.total_points, entry.total_activities), (700, 3))
+        response = self.client.get(reverse('stats'), {'user_id': str(self.user._id), 'granularity': 'week'})
+        self.assertEqual(response.data['totals']['calories'], 700)
+        
+        self.assertEqual(len(self.list_dates({})), 1)
+        self.assertEqual(self.list_dates({'date__gte': '2023-01-01', 'page_size': 2})[1:], ['2023-01-03', '2023-01-02'])
+        self.assertEqual(self.list_dates({'date__lte': '2023-01-02T12:00:00Z'}), ['2023-01-02'])
+    
+    def test_retried_upload_of_archived_activity(self):
+        """Test that re-sending an archived activity returns it instead of inserting it again."""
+        archive.archive_activities()
+        self.assertIn('dedupe_key_unique', get_db().activities_archive.index_information())
+        archived = get_db().activities_archive.find_one({'calories': 100})
+        data = {
+            'user_id': str(self.user._id), 'activity_type': 'Archery', 'duration': 30,
+            'calories': 100, 'date': '2023-01-02T08:00:00Z',
+        }
+        response = self.client.post(reverse('activity-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], str(archived['_id']))
+        response = self.client.post(reverse('activity-bulk'), [data], format='json')
+        self.assertEqual(response.data['existing'], [{'index': 0, 'id': str(archived['_id'])}])
+        
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(archive.archive_activities(), 0)
+        self.assertEqual(archive.archived_totals(), {str(self.user._id): (300, 2)})
+    
+    def test_archive_reads_honour_ids_fields_and_page_size(self):
+        """Test ?ids= and ?fields= on archive reads and that file reads stop once the page is full."""
+        self.client.post(reverse('activity-list'), {
+            'user_id': str(self.user._id), 'activity_type': 'Archery', 'duration': 30,
+            'calories': 300, 'date': '2023-01-04T08:00:00Z',
+        }, format='json')
+        ids = {activity.calories: str(activity._id) for activity in Activity.objects.all()}
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('octofit_tracker.archive._archive', archive.FileArchive(directory)):
+            self.assertEqual(archive.archive_activities(batch_size=1), 3)
+            params = {'date__gte': '2023-01-01', 'fields': 'id,calories'}
+            response = self.client.get(reverse('activity-list'), dict(params, ids=f'{ids[200]},{ids[100]}'))
+            self.assertEqual(response.data, [{'id': ids[200], 'calories': 200}, {'id': ids[100], 'calories': 100}])
+            
+            # The newest two of the three files hold the page and the row that shows there is a next one.
+            with mock.patch('octofit_tracker.archive.gzip.open', wraps=gzip.open) as opened:
+                response = self.client.get(reverse('activity-list'), dict(params, page_size=1))
+            self.assertEqual(response.data['results'], [{'id': ids[400], 'calories': 400}])
+            self.assertEqual(opened.call_count, 2)
+            calories = []
+            while response.data['next']:
+                response = self.client.get(response.data['next'])
+                calories += [row['calories'] for row in response.data['results']]
+            self.assertEqual(calories, [300, 200, 100])
+    
+    def test_file_archive_and_replayed_batch(self):
+        """Test the gzipped file backend and that finishing a batch twice counts it once."""
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('octofit_tracker.archive._archive', archive.FileArchive(directory)):
+            ids = [activity._id for activity in Activity.objects.filter(calories__lt=300)]
+            batch_id = ObjectId()
+            archive.get_archive().write(list(get_db().activities.find({'_id': {'$in': ids}})))
+            with mock.patch.object(get_db().activities.__class__, 'delete_many'):
+                archive._finish_batch(batch_id, ids)
+            archive._finish_batch(batch_id, ids)
+            self.assertEqual(archive.archived_totals(), {str(self.user._id): (300, 2)})
+            
+            self.assertEqual(archive.archive_activities(), 0)
+            self.assertEqual(self.list_dates({'date__lte': '2023-06-01'}), ['2023-01-03', '2023-01-02'])
+            self.assertEqual(len(self.list_dates({'date__gte': '2023-01-03'})), 2)
+
+
 class APIRootTestCase(APITestCase):
     """Test cases for API root endpoint."""
     
@@ -165,3 +1071,311 @@ class APIRootTestCase(APITestCase):
         self.assertIn('activities', response.data)
         self.assertIn('leaderboard', response.data)
         self.assertIn('workouts', response.data)
+
+
+class LeaderboardMaintenanceTestCase(APITestCase):
+    """Test cases for incremental leaderboard updates on activity writes."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='Team Alpha', description='The best team ever')
+        cls.alice = User.objects.create(name='Alice', email='alice@example.com', team_id=str(cls.team._id))
+        cls.bob = User.objects.create(name='Bob', email='bob@example.com', team_id=str(cls.team._id))
+    
+    def setUp(self):
+        self.client = APIClient()
+    
+    def post_activity(self, user, calories):
+        url = reverse('activity-list')
+        return self.client.post(url, {
+            'user_id': str(user._id),
+            'activity_type': 'Running',
+            'duration': 30,
+            'distance': 5.0,
+            'calories': calories,
+            'date': datetime.now()
+        }, format='json')
+    
+    def test_create_updates_totals_and_ranks(self):
+        """Test that creating activities increments totals and re-ranks entries."""
+        self.post_activity(self.alice, 300)
+        self.post_activity(self.bob, 200)
+        self.post_activity(self.bob, 200)
+        alice = Leaderboard.objects.get(user_id=str(self.alice._id))
+        bob = Leaderboard.objects.get(user_id=str(self.bob._id))
+        self.assertEqual((alice.total_points, alice.total_activities, alice.rank), (300, 1, 2))
+        self.assertEqual((bob.total_points, bob.total_activities, bob.rank), (400, 2, 1))
+        self.assertEqual(bob.user_name, 'Bob')
+        self.assertEqual(bob.team_name, 'Team Alpha')
+    
+    def test_delete_decrements_totals(self):
+        """Test that deleting an activity removes its points."""
+        self.post_activity(self.alice, 300)
+        response = self.post_activity(self.bob, 400)
+        url = reverse('activity-detail', args=[response.data['id']])
+        self.client.delete(url)
+        alice = Leaderboard.objects.get(user_id=str(self.alice._id))
+        bob = Leaderboard.objects.get(user_id=str(self.bob._id))
+        self.assertEqual((bob.total_points, bob.total_activities, bob.rank), (0, 0, 2))
+        self.assertEqual(alice.rank, 1)
+
+
+class ActivityFilterTestCase(APITestCase):
+    """Test cases for server-side activity filters."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='Team Alpha', description='The best team ever')
+        cls.alice = User.objects.create(name='Alice', email='alice@example.com', team_id=str(cls.team._id))
+        cls.bob = User.objects.create(name='Bob', email='bob@example.com', team_id='other')
+        for user, activity_type, duration, day in [
+            (cls.alice, 'Running', 30, 1),
+            (cls.alice, 'Running', 60, 8),
+            (cls.alice, 'Yoga', 45, 8),
+            (cls.bob, 'Running', 90, 8),
+        ]:
+            Activity.objects.create(
+                user_id=str(user._id),
+                activity_type=activity_type,
+                duration=duration,
+                calories=duration * 10,
+                date=datetime(2024, 1, day)
+            )
+    
+    def setUp(self):
+        self.client = APIClient()
+    
+    def list_activities(self, **params):
+        response = self.client.get(reverse('activity-list'), params, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+    
+    def test_filter_by_team_type_and_date(self):
+        """Test combining team, activity type and date range filters."""
+        results = self.list_activities(team_id=str(self.team._id), activity_type='Running', date__gte='2024-01-05')
+        self.assertEqual([(item['user_id'], item['duration']) for item in results], [(str(self.alice._id), 60)])
+    
+    def test_filter_by_min_duration(self):
+        """Test filtering by minimum duration."""
+        results = self.list_activities(min_duration=60)
+        self.assertEqual(sorted(item['duration'] for item in results), [60, 90])
+    
+    def test_invalid_filter_value(self):
+        """Test that malformed filter values are rejected."""
+        response = self.client.get(reverse('activity-list'), {'min_duration': 'long'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActivityBulkAPITestCase(APITestCase):
+    """Test cases for bulk activity ingestion."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.activity_data = {
+            'user_id': 'user123',
+            'activity_type': 'Running',
+            'duration': 30,
+            'distance': 5.0,
+            'calories': 300,
+            'date': '2024-01-01T08:00:00Z'
+        }
+    
+    def test_bulk_create_json(self):
+        """Test creating activities from a JSON array."""
+        url = reverse('activity-bulk')
+        items = [dict(self.activity_data, date=f'2024-01-0{day}T08:00:00Z') for day in (1, 2, 3)]
+        response = self.client.post(url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['created']), 3)
+        self.assertEqual(Activity.objects.count(), 3)
+        entry = Leaderboard.objects.get(user_id='user123')
+        self.assertEqual((entry.total_points, entry.total_activities), (900, 3))
+    
+    def test_bulk_create_ndjson_reports_item_errors(self):
+        """Test creating activities from NDJSON with an invalid item."""
+        url = reverse('activity-bulk')
+        body = '\n'.join([
+            json.dumps(self.activity_data),
+            json.dumps(dict(self.activity_data, duration='long')),
+        ])
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([item['index'] for item in response.data['created']], [0])
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertIn('duration', response.data['errors'][0]['errors'])
+        self.assertEqual(Activity.objects.count(), 1)
+
+
+class ActivityExportTestCase(APITestCase):
+    """Test cases for streaming activity export."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.team = Team.objects.create(name='Team Alpha', description='The best team ever')
+        self.alice = User.objects.create(name='Alice', email='alice@example.com', team_id=str(self.team._id))
+        for day, user_id in [(1, str(self.alice._id)), (2, str(self.alice._id)), (3, 'user123')]:
+            Activity.objects.create(
+                user_id=user_id,
+                activity_type='Running',
+                duration=30,
+                distance=5.0,
+                calories=300,
+                date=datetime(2024, 1, day)
+            )
+    
+    def export(self, **params):
+        response = self.client.get(reverse('activity-export'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+    
+    def test_export_ndjson(self):
+        """Test exporting all activities as NDJSON in date order."""
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([row['date'][:10] for row in rows], ['2024-01-01', '2024-01-02', '2024-01-03'])
+    
+    def test_export_csv_with_filters(self):
+        """Test exporting a team's activities in a date range as CSV."""
+        lines = self.export(output='csv', team_id=str(self.team._id), date__gte='2024-01-02').splitlines()
+        self.assertEqual(lines[0], 'id,user_id,activity_type,duration,distance,calories,date')
+        self.assertEqual(len(lines), 2)
+        self.assertIn(str(self.alice._id), lines[1])
+
+
+class StatsAPITestCase(APITestCase):
+    """Test cases for activity rollups and the stats endpoint."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='Team Alpha', description='The best team ever')
+        cls.alice = User.objects.create(name='Alice', email='alice@example.com', team_id=str(cls.team._id))
+        url = reverse('activity-list')
+        client = APIClient()
+        for date in ['2024-01-01T08:00:00Z', '2024-01-01T18:00:00Z', '2024-01-03T08:00:00Z']:
+            client.post(url, {
+                'user_id': str(cls.alice._id),
+                'activity_type': 'Running',
+                'duration': 30,
+                'distance': 5.0,
+                'calories': 300,
+                'date': date
+            }, format='json')
+    
+    def setUp(self):
+        self.client = APIClient()
+    
+    def get_stats(self, **params):
+        response = self.client.get(reverse('stats'), params, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+    
+    def test_user_daily_and_weekly_stats(self):
+        """Test that activity writes update user rollups."""
+        daily = self.get_stats(user_id=str(self.alice._id))
+        self.assertEqual([bucket['activities'] for bucket in daily['buckets']], [2, 1])
+        self.assertEqual(daily['totals']['calories'], 900)
+        weekly = self.get_stats(user_id=str(self.alice._id), granularity='week')
+        self.assertEqual(len(weekly['buckets']), 1)
+        self.assertEqual(weekly['buckets'][0]['duration'], 90)
+    
+    def test_team_stats_match_rebuild(self):
+        """Test that rebuilding rollups reproduces the incremental ones."""
+        before = self.get_stats(team_id=str(self.team._id))
+        call_command('rebuild_rollups', stdout=StringIO())
+        after = self.get_stats(team_id=str(self.team._id))
+        self.assertEqual(before['totals']['activities'], 3)
+        self.assertEqual(before, after)
+
+
+class FastListSerializerTestCase(TestCase):
+    """Test cases for the fast read-only list path."""
+    
+    def test_output_matches_model_serializers(self):
+        """Test that every model renders the same through both paths."""
+        team = Team.objects.create(name='Team Alpha', description='The best team ever')
+        User.objects.create(name='Alice', email='alice@example.com', team_id=str(team._id))
+        User.objects.create(name='Bob', email='bob@example.com')
+        Activity.objects.create(user_id='user123', activity_type='Yoga', duration=30, calories=150,
+                                date=datetime(2024, 1, 1, 8, 30))
+        Leaderboard.objects.create(user_id='user123', user_name='Alice', team_id='team123', team_name='Team Alpha')
+        Workout.objects.create(name='Morning Run', category='Cardio', difficulty='Medium', duration=30,
+                               calories_burn=300, description='Run')
+        for serializer_class in [UserSerializer, TeamSerializer, ActivitySerializer, LeaderboardSerializer,
+                                 WorkoutSerializer]:
+            queryset = serializer_class.Meta.model.objects.all()
+            fast = FastListSerializer(serializer_class)
+            expected = [dict(item) for item in serializer_class(queryset, many=True).data]
+            self.assertEqual(fast.to_representation(queryset.values(*fast.columns)), expected)
+
+
+class SnapshotTestCase(TestCase):
+    """Test cases for the test database snapshots and clones."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(name='Natasha', email='natasha@shield.com')
+    
+    def test_restore_snapshot(self):
+        """Test that restoring drops new collections, refills documents and rebuilds indexes."""
+        db = get_db()
+        indexes.sync_indexes(db)
+        snapshot = take_snapshot(db)
+        User.objects.create(name='Yelena', email='yelena@shield.com')
+        db.activities.drop_indexes()
+        db.scratch.insert_one({'value': 1})
+        restore_snapshot(db, snapshot)
+        self.assertEqual(list(User.objects.values_list('name', flat=True)), ['Natasha'])
+        self.assertIn('dedupe_key_unique', db.activities.index_information())
+        self.assertNotIn('scratch', db.list_collection_names())
+    
+    def test_clone_copies_collections_and_indexes(self):
+        """Test the per-worker clone used by --parallel."""
+        connection.creation._clone_test_db('snapshot', verbosity=0)
+        clone = get_client()[connection.creation.get_test_db_clone_settings('snapshot')['NAME']]
+        try:
+            self.assertEqual(clone.users.count_documents({}), 1)
+            self.assertEqual(clone.activities.index_information(), get_db().activities.index_information())
+        finally:
+            get_client().drop_database(clone.name)
+
+
+class SyncIndexesTestCase(TestCase):
+    """Test cases for declarative index management."""
+    
+    def test_sync_creates_declared_and_drops_stale_indexes(self):
+        """Test that syncing converges on the declared indexes."""
+        db = get_db()
+        db.activities.drop_indexes()
+        db.workouts.create_index([('category', 1)], name='stale_category')
+        actions = indexes.sync_indexes(db)
+        self.assertIn(('create', 'activities', 'user_id_date'), actions)
+        self.assertIn(('drop', 'workouts', 'stale_category'), actions)
+        self.assertIn('user_id_date', db.activities.index_information())
+        self.assertNotIn('stale_category', db.workouts.index_information())
+        self.assertEqual(indexes.sync_indexes(db), [])
+
+
+class PopulateDbTestCase(TestCase):
+    """Test cases for the populate_db command."""
+    
+    def populate(self, **options):
+        call_command('populate_db', stdout=StringIO(), **options)
+        return sorted((entry.total_points, entry.rank) for entry in Leaderboard.objects.all())
+    
+    def test_populate_superheroes(self):
+        """Test the default superhero roster."""
+        self.populate(seed=1)
+        self.assertEqual(User.objects.count(), 12)
+        self.assertEqual(Leaderboard.objects.count(), 12)
+        self.assertEqual(Workout.objects.count(), 10)
+    
+    def test_populate_synthetic_scale_is_deterministic(self):
+        """Test scaled generation with a seed and aggregated leaderboard ranks."""
+        first = self.populate(users=30, teams=3, activities_per_user=4, seed=7, batch_size=25)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Team.objects.count(), 3)
+        self.assertEqual(Activity.objects.count(), 120)
+        for points, rank in first:
+            self.assertEqual(rank, 1 + sum(1 for other, _ in first if other > points))
+        second = self.populate(users=30, teams=3, activities_per_user=4, seed=7)
+        self.assertEqual(first, second)
@@ -17,8 +17,12 @@ import os
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
+from . import async_views
 from .views import (
     api_root,
+    stats,
+    pool_metrics,
+    cache_metrics,
     UserViewSet,
     TeamViewSet,
     ActivityViewSet,
@@ -45,5 +49,11 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', api_root, name='api-root'),
     path('api/', api_root, name='api-root'),
+    path('api/stats/', stats, name='stats'),
+    path('api/metrics/pool/', pool_metrics, name='pool-metrics'),
+    path('api/metrics/cache/', cache_metrics, name='cache-metrics'),
+    path('api/async/activities/', async_views.activity_list, name='async-activity-list'),
+    path('api/async/leaderboard/', async_views.leaderboard_list, name='async-leaderboard-list'),
+    path('api/async/stats/', async_views.stats, name='async-stats'),
     path('api/', include(router.urls)),
 ]
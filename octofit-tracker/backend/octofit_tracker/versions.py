@@ -0,0 +1,29 @@
+"""
+Per-collection version counters.
+
+Every write path bumps the version of the collections it changes, so a
+set of versions identifies the state of the data an endpoint reads. The
+counters live in Mongo and are shared by every process.
+"""
+from pymongo import UpdateOne
+
+from .mongo import get_db
+
+VERSIONS_COLLECTION = 'collection_versions'
+
+
+def bump(*collections):
+    """Increment the version of each named collection."""
+    if collections:
+        get_db()[VERSIONS_COLLECTION].bulk_write([
+            UpdateOne({'_id': name}, {'$inc': {'version': 1}}, upsert=True)
+            for name in collections
+        ], ordered=False)
+
+
+def current(collections):
+    """Return {collection: version} for the named collections (0 if never written)."""
+    versions = dict.fromkeys(collections, 0)
+    for document in get_db()[VERSIONS_COLLECTION].find({'_id': {'$in': list(collections)}}):
+        versions[document['_id']] = document['version']
+    return versions
@@ -1,9 +1,31 @@
-from rest_framework import viewsets
-from rest_framework.decorators import api_view
+import copy
+import hashlib
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import quote_etag
+from django.utils.http import parse_etags
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from rest_framework import status, viewsets
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.decorators import action, api_view
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
+from . import archive, dedupe, ingest, leaderboard, lookups, profiling, rollups, teams, versions
+from .cache import get_response_cache
+from .expand import expand_rows
+from .export import EXPORT_FORMATS, EXPORT_PROJECTION
+from .filters import activity_filter, activity_lookups
 from .models import User, Team, Activity, Leaderboard, Workout
+from .mongo import from_document, get_db, to_document
+from .pagination import ActivityPagination, LeaderboardPagination
+from .parsers import NDJSONParser
+from .pool_metrics import pool_metrics as pool_metrics_listener
 from .serializers import (
+    FastListSerializer,
     UserSerializer,
     TeamSerializer,
     ActivitySerializer,
@@ -23,44 +45,616 @@ def api_root(request, format=None):
         'activities': reverse('activity-list', request=request, format=format),
         'leaderboard': reverse('leaderboard-list', request=request, format=format),
         'workouts': reverse('workout-list', request=request, format=format),
+        'stats': reverse('stats', request=request, format=format),
     })
 
 
-class UserViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+def stats(request, format=None):
+    """
+    Daily or weekly activity totals for a user or a team, read from the
+    materialized rollups. Requires ``user_id`` or ``team_id``; accepts
+    ``granularity`` (day or week) and ``date__gte``/``date__lte``.
+    """
+    collection_name, query = rollups.stats_query(request.query_params)
+    documents = get_db()[collection_name].find(query).sort('bucket_start', 1)
+    return Response(rollups.summarize_stats(query, documents))
+
+
+@api_view(['GET'])
+def pool_metrics(request, format=None):
+    """
+    Connection pool usage and checkout wait times of this process, per
+    MongoDB server address.
+    """
+    return Response(pool_metrics_listener.snapshot())
+
+
+@api_view(['GET'])
+def cache_metrics(request, format=None):
+    """Hit rate and size of this process's User and Team document cache."""
+    return Response(lookups.get_document_cache().stats())
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The request conflicts with a stored document.'
+    default_code = 'conflict'
+
+
+def is_read(view):
+    """Whether ``view`` answers a read: a GET or HEAD, or a POST to ``batch/``."""
+    return view.request is not None and (view.request.method in ('GET', 'HEAD') or view.action == 'batch')
+
+
+class ObjectIdLookupMixin:
+    """
+    Resolve detail routes by the string form of the document ObjectId.
+
+    djongo's ObjectIdField does not convert string lookups, so the URL
+    value is turned into an ObjectId before querying.
+    """
+
+    def get_object(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            self.kwargs[lookup_url_kwarg] = ObjectId(self.kwargs[lookup_url_kwarg])
+        except (InvalidId, TypeError):
+            raise Http404
+        return super().get_object()
+
+
+class SparseFieldsetMixin:
+    """
+    Limit the response to the serializer fields named in ``?fields=`` and
+    project the Mongo query down to the matching model fields.
+    """
+    fields_query_param = 'fields'
+
+    def get_requested_fields(self):
+        if not is_read(self):
+            return None
+        raw = self.request.query_params.get(self.fields_query_param)
+        if not raw:
+            return None
+        requested = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = sorted(set(requested) - set(self.get_serializer_class().Meta.fields))
+        if unknown:
+            raise ValidationError({self.fields_query_param: [f'Unknown fields: {", ".join(unknown)}.']})
+        return requested
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        if fields is not None:
+            ordering = getattr(self.pagination_class, 'ordering', ())
+            model_fields = {'_id' if name == 'id' else name for name in fields}
+            model_fields.update(name.lstrip('-') for name in ordering)
+            queryset = queryset.only(*model_fields)
+        return queryset
+
+
+class FastListMixin:
+    """
+    Serve list requests from ``values()`` rows rendered by
+    FastListSerializer instead of model instances and ModelSerializers.
+    The output is identical to the regular serializer output.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = FastListSerializer(self.get_serializer_class(), self.get_requested_fields())
+        ordering = [name.lstrip('-') for name in getattr(self.pagination_class, 'ordering', ())]
+        rows = queryset.values(*dict.fromkeys(serializer.columns + ordering))
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(rows))
+
+
+class BatchRetrieveMixin:
+    """
+    Fetch several documents by id with one ``$in`` query: ``?ids=a,b,c``
+    on the list route, or a POST of ``{"ids": [...]}`` to ``batch/`` for
+    long lists. Results follow the requested order and ids that do not
+    exist are left out.
+    """
+    ids_query_param = 'ids'
+    max_batch_ids = 1000
+
+    def list(self, request, *args, **kwargs):
+        raw = request.query_params.get(self.ids_query_param)
+        if raw is None:
+            return super().list(request, *args, **kwargs)
+        return self.batch_response([value.strip() for value in raw.split(',') if value.strip()])
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Retrieve the documents whose ids are listed in the request body."""
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list):
+            raise ValidationError({'ids': ['Expected a list of ids.']})
+        return self.batch_response(ids)
+
+    def batch_response(self, ids):
+        if len(ids) > self.max_batch_ids:
+            raise ValidationError({'ids': [f'At most {self.max_batch_ids} ids per request.']})
+        object_ids = []
+        for value in ids:
+            try:
+                object_ids.append(ObjectId(value))
+            except (InvalidId, TypeError):
+                raise ValidationError({'ids': [f'Invalid id "{value}".']})
+
+        serializer = FastListSerializer(self.get_serializer_class(), self.get_requested_fields())
+        by_id = {row['_id']: row for row in self.batch_rows(object_ids, serializer.columns)}
+        ordered = [by_id[object_id] for object_id in dict.fromkeys(object_ids) if object_id in by_id]
+        return Response(serializer.to_representation(ordered))
+
+    def batch_rows(self, object_ids, columns):
+        """Return the ``columns`` and _id of the documents with the given ids, in any order."""
+        return self.get_queryset().filter(_id__in=object_ids).values(*dict.fromkeys(columns + ['_id']))
+
+
+class ExpandMixin:
+    """
+    Embed the referenced objects named in ``?expand=`` into list, detail
+    and ``batch/`` responses. The reference fields are always included in the
+    response when expanding, even if ``?fields=`` leaves them out.
+    """
+    expand_query_param = 'expand'
+    expandable = ()
+    expand_user_field = None
+    expand_team_field = None
+
+    def get_expansions(self):
+        if not is_read(self):
+            return []
+        raw = self.request.query_params.get(self.expand_query_param)
+        if not raw:
+            return []
+        requested = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = sorted(set(requested) - set(self.expandable))
+        if unknown:
+            raise ValidationError({self.expand_query_param: [f'Cannot expand: {", ".join(unknown)}.']})
+        return requested
+
+    def get_requested_fields(self):
+        fields = super().get_requested_fields()
+        if fields is not None and self.get_expansions():
+            references = [name for name in (self.expand_user_field, self.expand_team_field) if name]
+            fields = list(dict.fromkeys(fields + references))
+        return fields
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.expand(rows)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        self.expand([response.data])
+        return response
+
+    def batch_response(self, ids):
+        response = super().batch_response(ids)
+        # list() expands the ?ids= form.
+        if self.action == 'batch':
+            self.expand(response.data)
+        return response
+
+    def expand(self, rows):
+        expansions = self.get_expansions()
+        if expansions:
+            expand_rows(rows, expansions, self.expand_user_field, self.expand_team_field)
+
+
+class CachedResponse(Exception):
+    """Raised from ``initial`` to answer a request with a 304 or a cached body."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETags and a response cache for GET requests.
+
+    The ETag hashes the request path, query string, Accept header, the
+    requesting user and the versions of ``cache_collections``. It is
+    checked once authentication, permissions, throttling and content
+    negotiation have run: a matching If-None-Match returns 304 Not
+    Modified; otherwise a cached rendering is served when present.
+    """
+    cache_collections = ()
+    etag = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or not self.cache_collections:
+            return
+        self.etag = self.get_etag(request)
+        if quote_etag(self.etag) in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            raise CachedResponse(HttpResponseNotModified())
+        cached = get_response_cache().get(self.etag)
+        if cached is not None:
+            content, content_type = cached
+            raise CachedResponse(HttpResponse(content, content_type=content_type))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, CachedResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag is None:
+            return response
+        if isinstance(response, Response):
+            # Rendered by this request's handler rather than the cache.
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            with profiling.timer('render'):
+                response.render()
+            get_response_cache().set(self.etag, (response.content, response['Content-Type']))
+        response['ETag'] = quote_etag(self.etag)
+        return response
+
+    def get_etag(self, request):
+        state = [
+            request.path,
+            request.META.get('QUERY_STRING', ''),
+            request.META.get('HTTP_ACCEPT', ''),
+            request.user.pk if request.user.is_authenticated else None,
+            sorted(versions.current(self.cache_collections).items()),
+        ]
+        return hashlib.sha1(repr(state).encode()).hexdigest()
+
+
+class DocumentViewSet(ObjectIdLookupMixin, SparseFieldsetMixin, BatchRetrieveMixin, FastListMixin,
+                      viewsets.ModelViewSet):
+    """
+    Base viewset for the octofit collections.
+    """
+
+
+class UserViewSet(ExpandMixin, DocumentViewSet):
     """
     API endpoint for managing users.
+
+    ``?expand=team`` embeds each user's team.
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    expandable = ('team',)
+    expand_team_field = 'team_id'
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(ConditionalGetMixin, DocumentViewSet):
     """
     API endpoint for managing teams.
+
+    The detail view includes the team's aggregated ``stats``.
     """
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
+    cache_collections = teams.STANDINGS_COLLECTIONS
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        team_id = str(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        response.data['stats'] = next(
+            (row for row in teams.team_standings() if row['team_id'] == team_id), None
+        )
+        return response
 
+    @action(detail=False, methods=['get'])
+    def ranking(self, request):
+        """Teams ranked by total points with member aggregates."""
+        return Response(teams.team_standings())
 
-class ActivityViewSet(viewsets.ModelViewSet):
+
+class ActivityViewSet(ExpandMixin, DocumentViewSet):
     """
     API endpoint for managing activities.
+
+    The list accepts the filters user_id, team_id, activity_type,
+    date__gte, date__lte and min_duration. ``?expand=user,team`` embeds
+    each activity's user and the user's team.
     """
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityPagination
+    expandable = ('user', 'team')
+    expand_user_field = 'user_id'
+    bulk_max_items = 5000
+    export_batch_size = 1000
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.filter(**activity_lookups(self.request.query_params))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        List activities. A ``date__gte``/``date__lte`` reaching before the
+        archive watermark also reads the archived activities, for ``?ids=``
+        too.
+        """
+        if self.ids_query_param in request.query_params or not archive.reads_archive(request.query_params):
+            return super().list(request, *args, **kwargs)
+        serializer = FastListSerializer(self.get_serializer_class(), self.get_requested_fields())
+        ordering = [name.lstrip('-') for name in self.pagination_class.ordering]
+        rows = self.paginator.paginate_documents(
+            archive.find_activities, activity_filter(request.query_params), request, Activity,
+            list(dict.fromkeys(serializer.columns + ordering)),
+        )
+        rows = [{column: row.get(column) for column in serializer.columns} for row in rows]
+        response = self.get_paginated_response(serializer.to_representation(rows))
+        self.expand(response.data['results'])
+        return response
+
+    def batch_rows(self, object_ids, columns):
+        if self.action != 'list' or not archive.reads_archive(self.request.query_params):
+            return super().batch_rows(object_ids, columns)
+        query = {'$and': [activity_filter(self.request.query_params), {'_id': {'$in': object_ids}}]}
+        return archive.find_activities(query, [('_id', 1)], len(object_ids), list(dict.fromkeys(columns + ['_id'])))
+
+    def create(self, request, *args, **kwargs):
+        """
+        Create an activity, or return the one already created by an
+        earlier upload of it (200) — matched by the ``Idempotency-Key``
+        header when sent, otherwise by content. In buffered ingestion mode
+        a new activity is queued for a batched write and the response is
+        202 with its id; 503 means the queue is full and the client should
+        retry.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        activity = Activity(**serializer.validated_data)
+        document = to_document(activity)
+        activity.dedupe_key = document['dedupe_key'] = dedupe.activity_key(
+            document, request.headers.get('Idempotency-Key')
+        )
+        if ingest.buffered():
+            existing = dedupe.existing_ids([activity.dedupe_key])
+            if existing:
+                return self._existing(existing[activity.dedupe_key])
+            document['_id'] = ObjectId()
+            try:
+                queued = ingest.get_buffer().submit(document)
+            except ingest.BufferFull as exc:
+                return Response(
+                    {'detail': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'}
+                )
+            # An identical upload still queued answers with the queued activity.
+            activity = from_document(Activity, queued)
+            return Response(self.get_serializer(activity).data, status=status.HTTP_202_ACCEPTED)
+
+        activity._id, created = dedupe.upsert_activity(document)
+        if not created:
+            return self._existing(activity._id)
+        document['_id'] = activity._id
+        ingest.record_inserted([document])
+        return Response(self.get_serializer(activity).data, status=status.HTTP_201_CREATED)
+
+    def _existing(self, activity_id):
+        activity = Activity.objects.filter(_id=activity_id).first()
+        if activity is None:
+            # Moved to the archive since it was created.
+            document, = archive.find_activities({'_id': activity_id}, [('_id', 1)], 1)
+            activity = from_document(Activity, document)
+        return Response(self.get_serializer(activity).data, status=status.HTTP_200_OK)
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        old = to_document(instance, add=False)
+        # A content key follows the edited content; an Idempotency-Key one stays.
+        if old.get('dedupe_key') == dedupe.content_key(old):
+            edited = copy.copy(instance)
+            for name, value in serializer.validated_data.items():
+                setattr(edited, name, value)
+            key = dedupe.content_key(to_document(edited, add=False))
+            if key != old['dedupe_key']:
+                try:
+                    get_db().activities.update_one({'_id': instance._id}, {'$set': {'dedupe_key': key}})
+                except DuplicateKeyError:
+                    raise Conflict('An activity with this content already exists.')
+                instance.dedupe_key = key
+        super().perform_update(serializer)
+        _record_activity_change(old=old, new=to_document(serializer.instance, add=False))
+
+    def perform_destroy(self, instance):
+        old = to_document(instance, add=False)
+        super().perform_destroy(instance)
+        _record_activity_change(old=old)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream activities as NDJSON (default) or CSV, selected with
+        ``?output=csv``. Accepts the same filters as the list.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {'detail': f'Unsupported output "{output}".'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, encode = EXPORT_FORMATS[output]
+        cursor = (
+            get_db().activities
+            .find(activity_filter(request.query_params), EXPORT_PROJECTION)
+            .sort([('date', 1), ('_id', 1)])
+            .batch_size(self.export_batch_size)
+        )
+        response = StreamingHttpResponse(encode(cursor), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="activities.{output}"'
+        return response
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Create many activities from a JSON array or an NDJSON body with one
+        unordered insert_many. Invalid or rejected items are reported by
+        their index in the request body, and items matching an activity
+        already stored (by ``idempotency_key`` or content) under
+        ``existing`` with its id.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of activities.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response(
+                {'detail': f'At most {self.bulk_max_items} activities per request.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
+        serializer = self.get_serializer(data=items, many=True)
+        errors = {}
+        if serializer.is_valid():
+            validated = list(enumerate(serializer.validated_data))
+        else:
+            validated = []
+            for index, (item, item_errors) in enumerate(zip(items, serializer.errors)):
+                if item_errors:
+                    errors[index] = item_errors
+                else:
+                    validated.append((index, serializer.child.run_validation(item)))
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+        documents = []
+        for index, data in validated:
+            document = to_document(Activity(**data))
+            document['dedupe_key'] = dedupe.activity_key(document, items[index].get('idempotency_key'))
+            documents.append((index, document))
+
+        # Activities already stored, or repeated in the body, are reported
+        # as existing instead of being inserted again.
+        stored = dedupe.existing_ids({document['dedupe_key'] for _, document in documents}) if documents else {}
+        existing = {}
+        new = {}
+        for index, document in documents:
+            if document['dedupe_key'] in stored or document['dedupe_key'] in new:
+                existing[index] = document['dedupe_key']
+            else:
+                new[document['dedupe_key']] = (index, document)
+        indexes = [index for index, _ in new.values()]
+        documents = [document for _, document in new.values()]
+
+        failed = set()
+        if documents:
+            try:
+                get_db().activities.insert_many(documents, ordered=False)
+            except BulkWriteError as exc:
+                for write_error in exc.details['writeErrors']:
+                    failed.add(write_error['index'])
+                    if write_error['code'] == ingest.DUPLICATE_KEY:
+                        # Stored by a concurrent upload since the lookup.
+                        existing[indexes[write_error['index']]] = documents[write_error['index']]['dedupe_key']
+                    else:
+                        errors[indexes[write_error['index']]] = {'non_field_errors': [write_error['errmsg']]}
+
+        inserted = [document for position, document in enumerate(documents) if position not in failed]
+        if inserted:
+            ingest.record_inserted(inserted)
+        stored.update((document['dedupe_key'], document['_id']) for document in inserted)
+        missing = set(existing.values()) - stored.keys()
+        if missing:
+            stored.update(dedupe.existing_ids(missing))
+        for index, key in list(existing.items()):
+            if key not in stored:
+                del existing[index]
+                errors[index] = {'non_field_errors': ['Duplicate of an activity that could not be created.']}
+
+        created = [
+            {'index': index, 'id': str(document['_id'])}
+            for position, (index, document) in enumerate(zip(indexes, documents))
+            if position not in failed
+        ]
+        if not errors:
+            response_status = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        elif created or existing:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'created': created,
+            'existing': [{'index': index, 'id': str(stored[key])} for index, key in sorted(existing.items())],
+            'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+        }, status=response_status)
+
+
+class LeaderboardViewSet(ConditionalGetMixin, DocumentViewSet):
     """
     API endpoint for viewing and managing leaderboard.
     """
     queryset = Leaderboard.objects.all()
     serializer_class = LeaderboardSerializer
+    pagination_class = LeaderboardPagination
+    cache_collections = ('leaderboard',)
+    max_top_k = 100
 
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        """The ``k`` best ranked entries (default 10), read from the rank index."""
+        k = self._positive_int_param('k', 10)
+        rows = self.get_queryset().order_by('rank', '_id')[:k]
+        return Response(self._render(rows))
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], url_path=r'around/(?P<user_id>[^/.]+)')
+    def around(self, request, user_id=None):
+        """
+        A user's entry with up to ``n`` neighbours (default 5) on each side,
+        found by two bounded range scans on the rank index.
+        """
+        n = self._positive_int_param('n', 5)
+        entry = self.get_queryset().filter(user_id=user_id).values('_id', 'rank').first()
+        if entry is None:
+            raise Http404
+        rank, entry_id = entry['rank'], entry['_id']
+        above = self.get_queryset().filter(
+            Q(rank__lt=rank) | Q(rank=rank, _id__lt=entry_id)
+        ).order_by('-rank', '-_id')[:n]
+        below = self.get_queryset().filter(
+            Q(rank__gt=rank) | Q(rank=rank, _id__gte=entry_id)
+        ).order_by('rank', '_id')[:n + 1]
+        return Response({
+            'rank': rank,
+            'results': self._render(above)[::-1] + self._render(below),
+        })
+
+    def _positive_int_param(self, name, default):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: ['A valid integer is required.']})
+        if value < 1:
+            raise ValidationError({name: ['Must be at least 1.']})
+        return min(value, self.max_top_k)
+
+    def _render(self, queryset):
+        serializer = FastListSerializer(self.get_serializer_class(), self.get_requested_fields())
+        return serializer.to_representation(queryset.values(*serializer.columns))
+
+
+class WorkoutViewSet(ConditionalGetMixin, DocumentViewSet):
     """
     API endpoint for managing workouts.
     """
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
+    cache_collections = ('workouts',)
+
+
+def _record_activity_change(old=None, new=None):
+    """Fold a single activity write into the leaderboard and rollups."""
+    leaderboard.apply_activity_change(old=old, new=new)
+    rollups.apply_activity_change(old=old, new=new)